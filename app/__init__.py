@@ -1,14 +1,70 @@
+import os
 from flask import Flask
-from .config import Config
-from .extensions import db, login_manager
+from sqlalchemy import event
+from .config import PERFILES
+from .services.cache_service import CLAVE_GLOBALES, instantanea
+from .extensions import db, login_manager, image_cache, image_storage, search_index, suggest_index, query_cache
 
-def create_app(config_class=Config):
+def _configurar_sqlite(app):
+    """SQLite se comporta como Postgres en lo que la app asume: FKs con ON DELETE y escrituras concurrentes."""
+    en_memoria = db.engine.url.database in (None, '', ':memory:')
+    busy_timeout = int(app.config.get('SQLITE_BUSY_TIMEOUT_MS', 15000))
+
+    @event.listens_for(db.engine, 'connect')
+    def _pragmas(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        cursor.execute('PRAGMA foreign_keys = ON')
+        cursor.execute(f'PRAGMA busy_timeout = {busy_timeout}')
+        if not en_memoria:
+            # WAL: los lectores no bloquean al que escribe (varios threads/workers en benchmarks)
+            cursor.execute('PRAGMA journal_mode = WAL')
+        cursor.close()
+
+
+def _crear_configuracion(app):
+    """
+    La fila única de configuración se crea al arrancar (create_app lo importa
+    gunicorn; el bloque __main__ de run.py no corre ahí). Solo con el esquema
+    al día: con AUTO_MIGRATE=0 la crea 'flask db-upgrade'.
+    """
+    from app.migrations import VERSION_ACTUAL, version_aplicada
+    from app.models import Configuracion
+
+    with app.app_context():
+        try:
+            if version_aplicada() >= VERSION_ACTUAL:
+                Configuracion.crear_si_falta()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Nota: no se pudo crear la configuración de la tienda: {e}")
+
+
+def create_app(config_class=None):
     app = Flask(__name__)
+    if config_class is None:
+        perfil = os.getenv('APP_PROFILE', 'default')
+        if perfil not in PERFILES:
+            raise ValueError(f"APP_PROFILE '{perfil}' no existe. Opciones: {', '.join(PERFILES)}.")
+        config_class = PERFILES[perfil]
     app.config.from_object(config_class)
+    if not app.config.get('SQLALCHEMY_DATABASE_URI'):
+        raise ValueError(
+            "DATABASE_URL no está configurada. "
+            "Configúrala en un archivo .env o como variable de entorno "
+            "(o usa APP_PROFILE=local para correr con SQLite)."
+        )
 
     # Inicializar extensiones
     db.init_app(app)
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            _configurar_sqlite(app)
     login_manager.init_app(app)
+    image_cache.init_app(app)
+    image_storage.init_app(app)
+    search_index.init_app(app)
+    suggest_index.init_app(app)
+    query_cache.init_app(app)
     
     login_manager.login_view = 'admin.admin_login'
     login_manager.login_message = 'Por favor, inicia sesión para acceder al panel admin.'
@@ -19,12 +75,17 @@ def create_app(config_class=Config):
         from .models import Admin
         return Admin.query.get(int(user_id))
         
+    def cargar_globales():
+        from .models import Categoria, Configuracion
+        categorias = Categoria.query.filter_by(activa=True).order_by(Categoria.nombre).all()
+        return [instantanea(c) for c in categorias], instantanea(Configuracion.get_solo())
+
     @app.context_processor
     def inject_globals():
-        from .models import Categoria, Configuracion
+        # Cacheado; se invalida solo cuando se confirma un cambio en categorías o configuración
         try:
-            categorias = Categoria.query.filter_by(activa=True).order_by(Categoria.nombre).all()
-            config_tienda = Configuracion.get_solo()
+            categorias, config_tienda = query_cache.obtener(CLAVE_GLOBALES, cargar_globales,
+                                                            tags=('Categoria', 'Configuracion'))
         except:
             categorias = []
             config_tienda = None
@@ -37,6 +98,10 @@ def create_app(config_class=Config):
             config_tienda=config_tienda
         )
 
+    # Helpers de imágenes (variantes y srcset) para los templates
+    from app.services.image_service import imagen_url, imagen_srcset
+    app.jinja_env.globals.update(imagen_url=imagen_url, imagen_srcset=imagen_srcset)
+
     # Registrar Blueprints
     from app.routes.main import main_bp
     from app.routes.admin import admin_bp
@@ -48,6 +113,16 @@ def create_app(config_class=Config):
     app.register_blueprint(checkout_bp)
     app.register_blueprint(api_bp, url_prefix='/api')
 
+    from app.commands import register_commands
+    register_commands(app)
+
+    from app.migrations import verificar_al_iniciar
+    verificar_al_iniciar(app)
+    _crear_configuracion(app)
+
+    from app.services.image_gc import iniciar_gc_programado
+    iniciar_gc_programado(app)
+
     # Errores globales
     @app.errorhandler(404)
     def page_not_found(e):
@@ -0,0 +1,112 @@
+import click
+from datetime import timedelta
+from app.extensions import db, image_storage
+
+
+def register_commands(app):
+    """Comandos de mantenimiento: se ejecutan con 'flask --app run <comando>'."""
+
+    @app.cli.command('db-upgrade')
+    def db_upgrade():
+        """Aplica las migraciones pendientes del esquema (ver app/migrations.py)."""
+        from app.migrations import aplicar, version_aplicada, VERSION_ACTUAL
+        from app.models import Configuracion
+
+        aplicadas = aplicar(log=click.echo)
+        if not aplicadas:
+            click.echo(f"El esquema ya está en la versión {VERSION_ACTUAL}.")
+        else:
+            click.echo(f"Esquema actualizado a la versión {version_aplicada()}.")
+        # Con AUTO_MIGRATE=0 el arranque no la crea: queda lista desde el deploy
+        Configuracion.crear_si_falta()
+
+    @app.cli.command('db-seed')
+    @click.option('--categorias', default=20, show_default=True)
+    @click.option('--productos', default=2000, show_default=True)
+    @click.option('--pedidos', default=20000, show_default=True)
+    @click.option('--resenas', default=10000, show_default=True)
+    @click.option('--imagenes', default=200, show_default=True, help='Fotos JPEG guardadas en la DB.')
+    @click.option('--imagen-kb', default=150, show_default=True, help='Tamaño aproximado de cada foto.')
+    @click.option('--detalles-max', default=5, show_default=True, help='Máximo de productos por pedido.')
+    @click.option('--dias', default=730, show_default=True, help='Antigüedad máxima de pedidos y reseñas.')
+    @click.option('--semilla', type=int, default=None, help='Para generar siempre los mismos datos.')
+    @click.option('--si', is_flag=True, help='No pedir confirmación.')
+    def db_seed(categorias, productos, pedidos, resenas, imagenes, imagen_kb, detalles_max, dias, semilla, si):
+        """
+        Carga datos sintéticos para pruebas de carga (se suman a los existentes).
+        Escala de producción: --categorias 200 --productos 50000 --pedidos 2000000 --resenas 500000
+        """
+        from time import perf_counter
+        from app.services.seed_service import generar
+
+        if not si:
+            click.confirm(f"Se van a insertar datos de prueba en {db.engine.url.render_as_string(hide_password=True)}. "
+                          f"¿Continuar?", abort=True)
+        inicio = perf_counter()
+        resumen = generar(categorias=categorias, productos=productos, pedidos=pedidos, resenas=resenas,
+                          imagenes=imagenes, imagen_kb=imagen_kb, detalles_max=detalles_max, dias=dias,
+                          semilla=semilla, log=click.echo)
+        click.echo(f"Listo: {sum(resumen.values())} filas en {perf_counter() - inicio:.1f}s.")
+
+    @app.cli.command('imagenes-migrar')
+    @click.option('--destino', type=click.Choice(['db', 'filesystem', 's3']), default=None,
+                  help='Backend destino (por defecto IMAGE_STORAGE).')
+    @click.option('--lote', default=50, show_default=True, help='Imágenes por commit.')
+    def imagenes_migrar(destino, lote):
+        """Mueve los bytes de las imágenes existentes al backend de storage indicado."""
+        destino = destino or app.config.get('IMAGE_STORAGE', 'db')
+        click.echo(f"Migrando imágenes a '{destino}'...")
+        imagenes, total_bytes = image_storage.migrar(destino=destino, lote=lote)
+        click.echo(f"Listo: {imagenes} imágenes migradas ({total_bytes / 1024 / 1024:.1f} MB).")
+
+    @app.cli.command('imagenes-gc')
+    @click.option('--ejecutar', is_flag=True, help='Borra de verdad (sin esto solo informa).')
+    @click.option('--lote', default=200, show_default=True, help='Imágenes revisadas por lote.')
+    @click.option('--min-edad-horas', type=float, default=None,
+                  help='No toca imágenes más nuevas (por defecto IMAGE_GC_MIN_EDAD_HORAS).')
+    def imagenes_gc(ejecutar, lote, min_edad_horas):
+        """Elimina imágenes que ya no usa ningún producto ni la configuración."""
+        from app.services.image_gc import lock_gc, recolectar_huerfanas
+
+        if min_edad_horas is None:
+            min_edad_horas = app.config.get('IMAGE_GC_MIN_EDAD_HORAS', 24)
+        with lock_gc() as tomado:
+            if not tomado:
+                click.echo("Otro proceso está corriendo el GC de imágenes; intentá más tarde.")
+                return
+            reporte = recolectar_huerfanas(ejecutar=ejecutar, lote=lote, min_edad=timedelta(hours=min_edad_horas))
+        for nombre in reporte['nombres']:
+            click.echo(f"  - {nombre}")
+        accion = "Eliminadas" if ejecutar else "Se eliminarían (dry-run)"
+        click.echo(f"{accion}: {reporte['imagenes']} imágenes, {reporte['bytes'] / 1024 / 1024:.2f} MB recuperados.")
+
+    @app.cli.command('resenas-recalcular')
+    def resenas_recalcular():
+        """Recalcula rating_count/rating_sum de los productos a partir de las reseñas."""
+        from app.models import Producto
+
+        actualizados = Producto.recalcular_calificaciones()
+        db.session.commit()
+        click.echo(f"Listo: {actualizados} productos recalculados.")
+
+    @app.cli.command('db-explain')
+    @click.option('--forzar-indices', is_flag=True,
+                  help='Postgres: desactiva el seq scan para verificar que hay un índice usable.')
+    @click.option('--verbose', is_flag=True, help='Muestra el plan completo de cada consulta.')
+    def db_explain(forzar_indices, verbose):
+        """Corre EXPLAIN sobre las consultas clave y falla si alguna recorre una tabla entera."""
+        from app.services.explain_service import verificar_planes
+
+        fallas = 0
+        for nombre, tablas, plan in verificar_planes(forzar_indices):
+            if tablas:
+                fallas += 1
+                click.echo(f"FALLA  {nombre}: recorrido secuencial de {', '.join(sorted(set(tablas)))}")
+            else:
+                click.echo(f"ok     {nombre}")
+            if verbose or tablas:
+                click.echo('       ' + plan.replace('\n', '\n       '))
+        if fallas:
+            click.echo(f"{fallas} consultas sin índice.")
+            raise SystemExit(1)
+        click.echo("Todas las consultas clave usan índices.")
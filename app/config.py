@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -6,13 +7,8 @@ load_dotenv()
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
     
-    # Configuración de Supabase
+    # Configuración de Supabase (create_app falla si no está, salvo con APP_PROFILE=local)
     DATABASE_URL = os.getenv('DATABASE_URL')
-    if not DATABASE_URL:
-        raise ValueError(
-            "DATABASE_URL no está configurada. "
-            "Configúrala en un archivo .env o como variable de entorno."
-        )
     
     SQLALCHEMY_DATABASE_URI = DATABASE_URL
     SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -20,11 +16,52 @@ class Config:
         "pool_pre_ping": True,
         "pool_recycle": 300,
     }
+    # Al arrancar, aplicar las migraciones pendientes (ver app/migrations.py).
+    # En producción conviene 0 y correr 'flask --app run db-upgrade' antes de levantar los workers.
+    AUTO_MIGRATE = os.getenv('AUTO_MIGRATE', '1') == '1'
 
     # Carpeta para fotos de productos
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'img', 'productos')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB max por archivo
 
+    # Dónde se guardan los bytes de las imágenes nuevas: 'db', 'filesystem' o 's3'
+    IMAGE_STORAGE = os.getenv('IMAGE_STORAGE', 'db')
+    IMAGE_STORAGE_DIR = os.getenv('IMAGE_STORAGE_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads'))
+    S3_BUCKET = os.getenv('S3_BUCKET')
+    S3_PREFIX = os.getenv('S3_PREFIX', 'productos/')
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')  # p. ej. http://localhost:9000 (MinIO)
+    S3_REGION = os.getenv('S3_REGION')
+    S3_ACCESS_KEY = os.getenv('S3_ACCESS_KEY')
+    S3_SECRET_KEY = os.getenv('S3_SECRET_KEY')
+
+    # Threads para procesar las fotos subidas (Pillow)
+    IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '4'))
+    # Threads aparte para las variantes (thumb/card/WebP): no demoran la próxima subida
+    IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', '2'))
+
+    # GC de imágenes huérfanas: cada cuántas horas corre solo (0 = solo con 'flask imagenes-gc')
+    IMAGE_GC_INTERVALO_HORAS = float(os.getenv('IMAGE_GC_INTERVALO_HORAS', '0'))
+    IMAGE_GC_MIN_EDAD_HORAS = float(os.getenv('IMAGE_GC_MIN_EDAD_HORAS', '24'))
+
+    # Caché local en disco de imágenes servidas desde la DB (0 MB = deshabilitada)
+    IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'estilo_fachero_imagenes'))
+    IMAGE_CACHE_MAX_MB = int(os.getenv('IMAGE_CACHE_MAX_MB', '256'))
+    # Tamaño de cada lectura parcial del blob al servir una imagen desde la DB
+    IMAGE_STREAM_CHUNK_KB = int(os.getenv('IMAGE_STREAM_CHUNK_KB', '256'))
+    # Las imágenes subidas tienen nombre uuid y nunca cambian: se cachean como 'immutable'
+    IMAGE_IMMUTABLE_CACHE = os.getenv('IMAGE_IMMUTABLE_CACHE', '1') == '1'
+
+    # Búsqueda del catálogo: 'auto' (tsvector en Postgres si existe, si no índice en memoria) o 'python'
+    SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'auto')
+    SEARCH_INDEX_TTL = int(os.getenv('SEARCH_INDEX_TTL', '300'))  # segundos (solo índice en memoria)
+
+    # Caché de consultas (categorías, configuración, envíos, catálogo): 'local' o 'redis'
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'local')
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_REDIS_PREFIX = os.getenv('CACHE_REDIS_PREFIX', 'ef:')
+    # Segundos; con 'local' es lo que tarda un cambio en verse en los otros workers
+    CACHE_TTL = int(os.getenv('CACHE_TTL', '60'))
+
     # Configuración de la tienda
     MI_EMAIL = os.getenv('MI_EMAIL', 'seba10gl1@gmail.com')
     GOOGLE_APPS_SCRIPT_URL = os.getenv('GOOGLE_APPS_SCRIPT_URL')
@@ -34,3 +71,23 @@ class Config:
 
     # Mercado Pago
     MERCADOPAGO_ACCESS_TOKEN = os.getenv('MERCADOPAGO_ACCESS_TOKEN')
+
+
+class LocalConfig(Config):
+    """
+    Perfil local (APP_PROFILE=local): SQLite, sin servidor de base de datos.
+    Sirve para levantar la app, correr los scripts verify_* y los benchmarks en
+    una laptop o en CI. DATABASE_URL puede apuntar a otro archivo o a
+    'sqlite://' (en memoria, una sola conexión compartida entre threads).
+    """
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL') or 'sqlite:///estilo_fachero.db'  # relativo a instance/
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    # Espera de SQLite por el lock de escritura antes de fallar con 'database is locked'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '15000'))
+    AUTO_MIGRATE = True
+
+
+PERFILES = {
+    'default': Config,
+    'local': LocalConfig,
+}
@@ -1,5 +1,14 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from app.services.image_cache import ImageCache
+from app.services.image_storage import ImageStorage
+from app.services.cache_service import QueryCache
+from app.services.search_service import IndiceBusqueda, IndiceSugerencias
 
 db = SQLAlchemy()
 login_manager = LoginManager()
+image_cache = ImageCache()
+image_storage = ImageStorage()
+search_index = IndiceBusqueda()
+suggest_index = IndiceSugerencias()
+query_cache = QueryCache()
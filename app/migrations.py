@@ -0,0 +1,230 @@
+"""
+Migraciones versionadas de la base de datos.
+
+Cada migración tiene un número, una descripción y una lista de pasos (SQL o
+funciones que reciben la conexión). Las aplicadas quedan registradas en la
+tabla 'schema_version'; al arrancar se hace una sola consulta para saber si hay
+pendientes. Para aplicarlas fuera del arranque (antes de levantar los workers):
+
+    flask --app run db-upgrade
+
+Las migraciones se escriben idempotentes (IF NOT EXISTS) porque las bases que
+ya existían antes de este sistema empiezan en la versión 0 con el esquema casi
+completo. Para agregar una, sumar una entrada al final de MIGRACIONES.
+"""
+from datetime import datetime
+from sqlalchemy import text
+from app.extensions import db, search_index
+
+# Clave para pg_advisory_lock: un solo proceso migra a la vez
+_LOCK_MIGRACIONES = 725430
+
+
+def _crear_tablas(conn):
+    db.metadata.create_all(bind=conn)
+
+
+def _agregar_columna(tabla, columna, tipo):
+    """ALTER TABLE ADD COLUMN si falta (SQLite no tiene ADD COLUMN IF NOT EXISTS)."""
+    def paso(conn):
+        if columna not in {c['name'] for c in db.inspect(conn).get_columns(tabla)}:
+            conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN {columna} {tipo}"))
+    return paso
+
+
+def _permitir_nulos(tabla, columna):
+    """
+    DROP NOT NULL si hace falta. SQLite no puede cambiar una columna: se
+    reconstruye la tabla con el esquema del modelo y se copian las filas.
+    """
+    def paso(conn):
+        inspector = db.inspect(conn)
+        columnas = inspector.get_columns(tabla)
+        if all(c['nullable'] for c in columnas if c['name'] == columna):
+            return
+        if conn.dialect.name != 'sqlite':
+            conn.execute(text(f"ALTER TABLE {tabla} ALTER COLUMN {columna} DROP NOT NULL"))
+            return
+        # Los nombres de índice son globales en SQLite: los de la tabla vieja se borran antes de recrearlos
+        for indice in inspector.get_indexes(tabla):
+            conn.execute(text(f"DROP INDEX IF EXISTS {indice['name']}"))
+        anterior = f"_{tabla}_anterior"
+        nombres = ', '.join(c['name'] for c in columnas)
+        conn.execute(text(f"ALTER TABLE {tabla} RENAME TO {anterior}"))
+        db.metadata.tables[tabla].create(bind=conn)
+        conn.execute(text(f"INSERT INTO {tabla} ({nombres}) SELECT {nombres} FROM {anterior}"))
+        conn.execute(text(f"DROP TABLE {anterior}"))
+    return paso
+
+
+def _recalcular_calificaciones(conn):
+    conn.execute(text(
+        "UPDATE productos SET "
+        "rating_count = (SELECT COUNT(*) FROM resenas WHERE resenas.producto_id = productos.id), "
+        "rating_sum = (SELECT COALESCE(SUM(calificacion), 0) FROM resenas WHERE resenas.producto_id = productos.id)"
+    ))
+
+
+# (versión, descripción, pasos, dialectos donde corre o None para todos)
+MIGRACIONES = [
+    (1, 'Esquema base y columnas agregadas antes del versionado', [
+        _crear_tablas,
+    ], None),
+    (2, 'Columnas de pedidos y configuración (ALTERs históricos de run.py)', [
+        "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS estado VARCHAR(50) DEFAULT 'Pendiente'",
+        "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS pagado BOOLEAN DEFAULT FALSE",
+        "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS codigo_seguimiento VARCHAR(100)",
+        "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS link_seguimiento VARCHAR(300)",
+        "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS empresa_envio VARCHAR(100)",
+        "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS metodo_pago VARCHAR(50) DEFAULT 'transferencia'",
+        "ALTER TABLE configuracion ADD COLUMN IF NOT EXISTS hero_image_1 VARCHAR(255)",
+        "ALTER TABLE configuracion ADD COLUMN IF NOT EXISTS hero_image_2 VARCHAR(255)",
+        "ALTER TABLE configuracion ADD COLUMN IF NOT EXISTS hero_image_3 VARCHAR(255)",
+        "ALTER TABLE configuracion ADD COLUMN IF NOT EXISTS hero_image_4 VARCHAR(255)",
+        "ALTER TABLE productos ADD COLUMN IF NOT EXISTS umbral_stock INTEGER DEFAULT 5",
+        "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS cupon_codigo VARCHAR(50)",
+        "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS descuento_monto FLOAT DEFAULT 0",
+        "ALTER TABLE configuracion ADD COLUMN IF NOT EXISTS descuento_transferencia FLOAT DEFAULT 10.0",
+        "ALTER TABLE configuracion DROP COLUMN IF EXISTS google_apps_script_url",
+        "ALTER TABLE configuracion DROP COLUMN IF EXISTS email_webhook_token",
+    ], ('postgresql',)),
+    (3, 'Metadatos y storage de imágenes', [
+        _permitir_nulos('producto_imagenes', 'datos'),
+        _agregar_columna('producto_imagenes', 'etag', 'VARCHAR(64)'),
+        _agregar_columna('producto_imagenes', 'creado', 'TIMESTAMP'),
+        _agregar_columna('producto_imagenes', 'almacenamiento', "VARCHAR(20) DEFAULT 'db'"),
+        _agregar_columna('producto_imagenes', 'tamano', 'INTEGER'),
+        _agregar_columna('producto_imagenes', 'hash_origen', 'VARCHAR(64)'),
+        _agregar_columna('producto_imagenes', 'referencias', 'INTEGER DEFAULT 1'),
+        # Filas anteriores (o copiadas al reconstruir la tabla en SQLite, que no trae los DEFAULT)
+        "UPDATE producto_imagenes SET creado = CURRENT_TIMESTAMP WHERE creado IS NULL",
+        "UPDATE producto_imagenes SET almacenamiento = 'db' WHERE almacenamiento IS NULL",
+        "UPDATE producto_imagenes SET referencias = 1 WHERE referencias IS NULL",
+        "CREATE INDEX IF NOT EXISTS ix_producto_imagenes_hash_origen ON producto_imagenes (hash_origen)",
+    ], None),
+    (4, 'Agregados de calificaciones en productos', [
+        _agregar_columna('productos', 'rating_count', 'INTEGER NOT NULL DEFAULT 0'),
+        _agregar_columna('productos', 'rating_sum', 'INTEGER NOT NULL DEFAULT 0'),
+    ], None),
+    (5, 'Backfill de rating_count/rating_sum', [
+        _recalcular_calificaciones,
+    ], None),
+    (6, 'Búsqueda full-text (español + unaccent, índice GIN)', [
+        "CREATE EXTENSION IF NOT EXISTS unaccent",
+        """DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'es_unaccent') THEN
+                CREATE TEXT SEARCH CONFIGURATION es_unaccent (COPY = spanish);
+                ALTER TEXT SEARCH CONFIGURATION es_unaccent
+                    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+            END IF;
+        END $$""",
+        """ALTER TABLE productos ADD COLUMN IF NOT EXISTS busqueda_tsv tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('es_unaccent', coalesce(nombre, '')), 'A') ||
+                setweight(to_tsvector('es_unaccent', coalesce(descripcion, '')), 'B')
+            ) STORED""",
+        "CREATE INDEX IF NOT EXISTS ix_productos_busqueda_tsv ON productos USING GIN (busqueda_tsv)",
+    ], ('postgresql',)),
+    (7, 'Índices de los filtros más usados', [
+        "CREATE INDEX IF NOT EXISTS ix_productos_activo_categoria_id ON productos (activo, categoria_id, id)",
+        "CREATE INDEX IF NOT EXISTS ix_productos_activo_precio ON productos (activo, precio)",
+        "CREATE INDEX IF NOT EXISTS ix_pedidos_fecha_pedido_id ON pedidos (fecha_pedido, id)",
+        "CREATE INDEX IF NOT EXISTS ix_pedidos_email_cliente ON pedidos (email_cliente)",
+        "CREATE INDEX IF NOT EXISTS ix_detalles_pedido_pedido_id ON detalles_pedido (pedido_id)",
+        "CREATE INDEX IF NOT EXISTS ix_detalles_pedido_producto_id ON detalles_pedido (producto_id)",
+        "CREATE INDEX IF NOT EXISTS ix_resenas_producto_id_fecha ON resenas (producto_id, fecha)",
+    ], None),
+    (8, 'Clave de idempotencia del checkout', [
+        _agregar_columna('pedidos', 'clave_idempotencia', 'VARCHAR(64)'),
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_pedidos_clave_idempotencia ON pedidos (clave_idempotencia)",
+    ], None),
+]
+
+VERSION_ACTUAL = MIGRACIONES[-1][0]
+
+
+def version_aplicada(conn=None):
+    """Última versión registrada en schema_version (0 si la tabla no existe)."""
+    if conn is None:
+        with db.engine.connect() as conn:
+            return version_aplicada(conn)
+    if not db.inspect(conn).has_table('schema_version'):
+        return 0
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+
+def pendientes(conn=None):
+    actual = version_aplicada(conn)
+    return [m for m in MIGRACIONES if m[0] > actual]
+
+
+def _crear_tabla_version(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, descripcion VARCHAR(200), aplicada TIMESTAMP)"
+    ))
+
+
+def aplicar(log=print):
+    """
+    Aplica las migraciones pendientes, cada una en su propia transacción junto
+    con su registro en schema_version. Si una falla se detiene (y se propaga el
+    error): las siguientes no corren. Devuelve la lista de versiones aplicadas.
+    """
+    dialecto = db.engine.dialect.name
+    aplicadas = []
+    with db.engine.connect() as lock_conn:
+        if dialecto == 'postgresql':
+            # Otros workers esperan acá y después ven que no queda nada pendiente
+            lock_conn.execute(text("SELECT pg_advisory_lock(:k)"), {'k': _LOCK_MIGRACIONES})
+            lock_conn.commit()
+        try:
+            with db.engine.begin() as conn:
+                _crear_tabla_version(conn)
+            for version, descripcion, pasos, dialectos in pendientes():
+                aplica = dialectos is None or dialecto in dialectos
+                with db.engine.begin() as conn:
+                    if aplica:
+                        for paso in pasos:
+                            if callable(paso):
+                                paso(conn)
+                            else:
+                                conn.execute(text(paso))
+                    conn.execute(
+                        text("INSERT INTO schema_version (version, descripcion, aplicada) VALUES (:v, :d, :a)"),
+                        {'v': version, 'd': descripcion, 'a': datetime.now()}
+                    )
+                if aplica:
+                    log(f"Migración {version} aplicada: {descripcion}")
+                else:
+                    log(f"Migración {version} registrada (solo {', '.join(dialectos)}): {descripcion}")
+                aplicadas.append(version)
+        finally:
+            if aplicadas:
+                # La búsqueda full-text depende de una columna que crea una migración
+                search_index.reiniciar()
+            if dialecto == 'postgresql':
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {'k': _LOCK_MIGRACIONES})
+                lock_conn.commit()
+    return aplicadas
+
+
+def verificar_al_iniciar(app):
+    """
+    Una sola consulta al arrancar. Si hay migraciones pendientes las aplica
+    (AUTO_MIGRATE=1, por defecto) o solo avisa (AUTO_MIGRATE=0, cuando se
+    corre 'flask db-upgrade' en el deploy antes de los workers).
+    """
+    with app.app_context():
+        try:
+            version = version_aplicada()
+        except Exception as e:
+            print(f"Nota: no se pudo verificar la versión del esquema: {e}")
+            return
+        if version >= VERSION_ACTUAL:
+            return
+        if not app.config.get('AUTO_MIGRATE', True):
+            print(f"Aviso: el esquema está en la versión {version} y el código espera la {VERSION_ACTUAL}. "
+                  f"Correr 'flask --app run db-upgrade'.")
+            return
+        aplicar()
@@ -1,4 +1,5 @@
 from app.extensions import db
+from flask import g, has_app_context
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
@@ -23,8 +24,30 @@ class ProductoImagen(db.Model):
     __tablename__ = 'producto_imagenes'
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(255), unique=True, nullable=False)
-    datos = db.Column(db.LargeBinary, nullable=False)
+    # Diferida: cargar la fila (listados, borrados) no trae el blob.
+    # Es NULL cuando los bytes están en otro backend (ver services/image_storage.py)
+    datos = db.deferred(db.Column(db.LargeBinary, nullable=True))
     mimetype = db.Column(db.String(100), nullable=False)
+    almacenamiento = db.Column(db.String(20), default='db')  # db | filesystem | s3
+    tamano = db.Column(db.Integer)  # bytes
+    # Deduplicación: sha256 del archivo subido y cuántas fotos/hero la usan (solo en el original)
+    hash_origen = db.Column(db.String(64), index=True)
+    referencias = db.Column(db.Integer, default=1)
+    etag = db.Column(db.String(64))  # sha256 del contenido, calculado al subir
+    creado = db.Column(db.DateTime, default=datetime.now)
+
+    @staticmethod
+    def leer_por_partes(imagen_id, tamano_total, tamano_parte=256 * 1024):
+        """Lee 'datos' de a partes con substr() en la DB, sin materializar todo el blob en memoria."""
+        inicio = 1  # substr es 1-indexado
+        while inicio <= tamano_total:
+            parte = db.session.query(
+                db.func.substr(ProductoImagen.datos, inicio, tamano_parte, type_=db.LargeBinary)
+            ).filter(ProductoImagen.id == imagen_id).scalar()
+            if not parte:
+                break
+            yield bytes(parte)
+            inicio += tamano_parte
 
 
 class TipoEnvio(db.Model):
@@ -45,12 +68,20 @@ class TipoEnvio(db.Model):
 
 class Producto(db.Model):
     __tablename__ = 'productos'
+    __table_args__ = (
+        # Catálogo: activos de una categoría, del más nuevo al más viejo
+        db.Index('ix_productos_activo_categoria_id', 'activo', 'categoria_id', 'id'),
+        # Catálogo ordenado por precio
+        db.Index('ix_productos_activo_precio', 'activo', 'precio'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(200), nullable=False)
     tipo = db.Column(db.String(50))  # Mantenido temporalmente para compatibilidad
     categoria_id = db.Column(db.Integer, db.ForeignKey('categorias.id'))
     descripcion = db.Column(db.Text)
-    fotos = db.Column(db.JSON)  # lista de nombres/urls: ["foto1.jpg", "foto2.jpg"]
+    # Lista de nombres/urls: ["foto1.jpg", "foto2.jpg"]. none_as_null: sin fotos es NULL
+    # (y no el JSON 'null'), igual en Postgres y en SQLite.
+    fotos = db.Column(db.JSON(none_as_null=True))
     stock = db.Column(db.Integer, default=0)
     precio = db.Column(db.Float, nullable=False)
     peso_g = db.Column(db.Integer, default=100)
@@ -59,21 +90,47 @@ class Producto(db.Model):
     largo_cm = db.Column(db.Integer, default=10)
     activo = db.Column(db.Boolean, default=True)
     umbral_stock = db.Column(db.Integer, default=5)
+    # Agregados de reseñas (se mantienen al crear/borrar reseñas, ver registrar_calificacion)
+    rating_count = db.Column(db.Integer, default=0, nullable=False)
+    rating_sum = db.Column(db.Integer, default=0, nullable=False)
     
     categoria = db.relationship('Categoria', backref='productos')
 
     def promedio_calificacion(self):
         """Devuelve el promedio de estrellas."""
-        if not self.resenas:
+        if not self.rating_count:
             return 0
-        total = sum([r.calificacion for r in self.resenas])
-        return round(total / len(self.resenas), 1)
+        return round((self.rating_sum or 0) / self.rating_count, 1)
+
+    @staticmethod
+    def registrar_calificacion(producto_id, calificacion, cantidad=1):
+        """
+        Suma (cantidad=1) o resta (cantidad=-1) una reseña a los agregados del producto.
+        Es un UPDATE atómico en la transacción actual: reseñas simultáneas no se pisan.
+        """
+        Producto.query.filter_by(id=producto_id).update({
+            Producto.rating_count: Producto.rating_count + cantidad,
+            Producto.rating_sum: Producto.rating_sum + calificacion * cantidad,
+        }, synchronize_session=False)
+
+    @staticmethod
+    def recalcular_calificaciones():
+        """Recalcula rating_count/rating_sum de todos los productos desde la tabla de reseñas."""
+        conteo = db.select(db.func.count(Resena.id)).where(Resena.producto_id == Producto.id).scalar_subquery()
+        suma = db.select(db.func.coalesce(db.func.sum(Resena.calificacion), 0)).where(
+            Resena.producto_id == Producto.id).scalar_subquery()
+        return Producto.query.update({Producto.rating_count: conteo, Producto.rating_sum: suma},
+                                     synchronize_session=False)
 
     def fotos_lista(self):
-        """Devuelve la lista de fotos (si fotos es None, lista vacía)."""
+        """
+        Devuelve una copia de la lista de fotos (si fotos es None, lista vacía).
+        Es copia porque la columna JSON no detecta cambios in-place: hay que
+        reasignar producto.fotos con una lista nueva para que se guarde.
+        """
         if self.fotos is None:
             return []
-        return self.fotos if isinstance(self.fotos, list) else []
+        return list(self.fotos) if isinstance(self.fotos, list) else []
 
     def primera_foto(self):
         """Primera foto para vista previa."""
@@ -114,6 +171,13 @@ class Admin(UserMixin, db.Model):
 
 class Pedido(db.Model):
     __tablename__ = 'pedidos'
+    __table_args__ = (
+        # Listado de ventas (paginado por fecha, id)
+        db.Index('ix_pedidos_fecha_pedido_id', 'fecha_pedido', 'id'),
+        db.Index('ix_pedidos_email_cliente', 'email_cliente'),
+        # Un envío repetido del checkout (doble click, reintento) no crea otro pedido
+        db.Index('ux_pedidos_clave_idempotencia', 'clave_idempotencia', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     nombre_cliente = db.Column(db.String(200), nullable=False)
     email_cliente = db.Column(db.String(120), nullable=False)
@@ -135,6 +199,8 @@ class Pedido(db.Model):
     metodo_pago = db.Column(db.String(50), default='transferencia')
     cupon_codigo = db.Column(db.String(50))
     descuento_monto = db.Column(db.Float, default=0)
+    # Generada en el formulario de checkout (ver checkout_service.resultado_previo)
+    clave_idempotencia = db.Column(db.String(64))
 
     detalles = db.relationship('DetallePedido', backref='pedido', lazy=True, cascade='all, delete-orphan')
 
@@ -160,6 +226,10 @@ class Pedido(db.Model):
 
 class DetallePedido(db.Model):
     __tablename__ = 'detalles_pedido'
+    __table_args__ = (
+        db.Index('ix_detalles_pedido_pedido_id', 'pedido_id'),
+        db.Index('ix_detalles_pedido_producto_id', 'producto_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     pedido_id = db.Column(db.Integer, db.ForeignKey('pedidos.id'), nullable=False)
     producto_id = db.Column(db.Integer, db.ForeignKey('productos.id', ondelete='SET NULL'))
@@ -180,6 +250,9 @@ class DetallePedido(db.Model):
 
 class Resena(db.Model):
     __tablename__ = 'resenas'
+    __table_args__ = (
+        db.Index('ix_resenas_producto_id_fecha', 'producto_id', 'fecha'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     producto_id = db.Column(db.Integer, db.ForeignKey('productos.id', ondelete='CASCADE'), nullable=False)
     nombre_cliente = db.Column(db.String(100), nullable=False)
@@ -232,12 +305,39 @@ class Configuracion(db.Model):
 
     @staticmethod
     def get_solo():
-        """Retrieve the single configuration record or create it if missing."""
+        """
+        Retrieve the single configuration record (solo lectura).
+
+        Se memoriza en flask.g: una sola consulta por request aunque la pidan el
+        checkout, los mails y el context processor. Si la fila todavía no existe
+        devuelve una instancia sin guardar con los valores por defecto; la fila
+        se crea al arrancar (create_app o 'flask db-upgrade') con crear_si_falta().
+        """
+        if has_app_context() and '_configuracion' in g:
+            return g._configuracion
+        config = Configuracion.query.first() or Configuracion._por_defecto()
+        if has_app_context():
+            g._configuracion = config
+        return config
+
+    @staticmethod
+    def _por_defecto():
+        valores = {
+            c.key: c.default.arg for c in Configuracion.__table__.columns
+            if c.default is not None and c.default.is_scalar
+        }
+        return Configuracion(**valores)
+
+    @staticmethod
+    def crear_si_falta():
+        """Devuelve la fila de configuración, creándola (con commit) si no existe."""
         config = Configuracion.query.first()
         if not config:
             config = Configuracion()
             db.session.add(config)
             db.session.commit()
+        if has_app_context():
+            g._configuracion = config
         return config
 
 
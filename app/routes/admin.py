@@ -2,9 +2,10 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_user, login_required, logout_user, current_user
 from sqlalchemy import func
 from datetime import datetime, timedelta
-from app.extensions import db
+from app.extensions import db, image_cache, image_storage, suggest_index
 from app.models import Admin, Producto, Pedido, Categoria, Configuracion, CuponDescuento, Resena, DetallePedido, ProductoImagen
 from app.services.email_service import enviar_mail_despacho
+from app.services.pagination import paginar
 from flask import current_app
 
 admin_bp = Blueprint('admin', __name__)
@@ -89,7 +90,7 @@ def admin_panel():
 @admin_bp.route('/productos')
 @login_required
 def admin_productos():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     search = request.args.get('search', '').strip()
     filtro_categoria = request.args.get('categoria_id', type=int)
     filtro_estado = request.args.get('estado', '').strip()
@@ -105,7 +106,7 @@ def admin_productos():
     elif filtro_estado == 'inactivo':
         query = query.filter(Producto.activo == False)
         
-    productos = query.order_by(Producto.id.desc()).paginate(page=page, per_page=10, error_out=False)
+    productos = paginar(query, [(Producto.id, 'desc')], cursor=cursor, per_page=10, tags=('Producto',))
     categorias = Categoria.query.order_by(Categoria.nombre).all()
     
     return render_template('admin/productos.html', 
@@ -120,7 +121,7 @@ def admin_productos():
 def admin_ventas():
     filtro_cliente = request.args.get('cliente', '').strip()
     filtro_fecha = request.args.get('fecha', '').strip()
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     
     query = Pedido.query
     
@@ -138,7 +139,9 @@ def admin_ventas():
         except Exception:
             pass
     
-    pedidos = query.order_by(Pedido.fecha_pedido.desc()).paginate(page=page, per_page=15, error_out=False)
+    # Por cursor (fecha, id): las páginas profundas no escanean todo el OFFSET
+    pedidos = paginar(query, [(Pedido.fecha_pedido, 'desc'), (Pedido.id, 'desc')],
+                      cursor=cursor, per_page=15, tags=('Pedido',))
     
     return render_template('admin/ventas.html', pedidos=pedidos, filtro_cliente=filtro_cliente, filtro_fecha=filtro_fecha)
 
@@ -217,58 +220,85 @@ def admin_actualizar_venta(id):
 import os
 from uuid import uuid4
 from flask import jsonify
-from PIL import Image
-import io
+import hashlib
+from collections import Counter
+from app.services.image_service import procesar_subidas, programar_variantes, nombres_relacionados
+from app.services.checkout_service import al_confirmar
 from app.models import ProductoImagen, TipoEnvio, Categoria
 from app.models import TIPOS_PRODUCTO  # Keep for backwards compatibility if needed
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
+def _procesar_y_guardar_imagenes(files, prefix="", max_size=(1200, 1200), quality=75):
+    """
+    Procesa en paralelo las imágenes subidas (redimensiona y comprime) y las guarda.
+    Si el mismo archivo ya se había subido, reutiliza esa imagen y suma una referencia.
+    Las variantes (thumb, card, WebP) se generan en segundo plano.
+    Devuelve la lista de nombres, en el orden de los archivos.
+    """
+    archivos = []
+    for file in files:
+        if file and file.filename and _allowed_file(file.filename):
+            file.seek(0)
+            datos = file.read()
+            huella = hashlib.sha256(datos)
+            # El prefijo es parte del nombre: una foto de producto no puede resolver a un 'hero_N_...'
+            huella.update(repr((prefix, max_size, quality)).encode())
+            archivos.append((file.filename, datos, huella.hexdigest()))
+
+    hashes = {h for _, _, h in archivos}
+    existentes = {
+        fila.hash_origen: fila
+        for fila in ProductoImagen.query.filter(ProductoImagen.hash_origen.in_(hashes)).all()
+    } if hashes else {}
+
+    # Solo se procesa una vez cada contenido nuevo (aunque venga repetido en la misma subida)
+    nuevos = {}
+    for filename, datos, h in archivos:
+        if h not in existentes and h not in nuevos:
+            nuevos[h] = (filename, datos)
+    procesados = procesar_subidas(list(nuevos.values()), prefix=prefix, max_size=max_size, quality=quality)
+
+    usos = Counter(h for _, _, h in archivos)
+    for h, fila in existentes.items():
+        # Incremento en SQL para no pisar a otra subida concurrente del mismo archivo
+        fila.referencias = func.coalesce(ProductoImagen.referencias, 1) + usos[h]
+    for h, (nombre, datos, mimetype) in zip(nuevos, procesados):
+        existentes[h] = image_storage.guardar(nombre, datos, mimetype, etag=hashlib.sha256(datos).hexdigest(),
+                                              hash_origen=h, referencias=usos[h])
+    programar_variantes(procesados, quality=quality)
+
+    return [existentes[h].nombre for _, _, h in archivos]
+
 def _procesar_y_guardar_imagen(file, prefix="", max_size=(1200, 1200), quality=75):
-    """Procesa una imagen (redimensiona y comprime) y la guarda en la DB."""
-    if not file or not file.filename or not _allowed_file(file.filename):
-        return None
-        
-    ext = file.filename.rsplit('.', 1)[1].lower()
-    # Usamos webp para hero images si es posible, o mantenemos el original si es gif
-    if ext == 'gif':
-        nombre_seguro = f"{prefix}{uuid4().hex}.gif"
-        file.seek(0)
-        datos = file.read()
-        mimetype = 'image/gif'
-    else:
-        # Procesar con Pillow
-        file.seek(0)
-        img = Image.open(file)
-        
-        # Convertir a RGB si es necesario
-        if img.mode in ("RGBA", "P"):
-            target_format = "WEBP"
-            mimetype = "image/webp"
-            ext_final = "webp"
-        else:
-            img = img.convert("RGB")
-            target_format = "JPEG"
-            mimetype = "image/jpeg"
-            ext_final = "jpg"
-            
-        # Resize manteniendo aspect ratio
-        img.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        # Guardar en buffer
-        buffer = io.BytesIO()
-        img.save(buffer, format=target_format, quality=quality, optimize=True)
-        buffer.seek(0)
-        datos = buffer.read()
-        nombre_seguro = f"{prefix}{uuid4().hex}.{ext_final}"
-    
-    nueva_imagen = ProductoImagen(
-        nombre=nombre_seguro,
-        datos=datos,
-        mimetype=mimetype
-    )
-    db.session.add(nueva_imagen)
-    return nombre_seguro
+    """Procesa una imagen y la guarda. Devuelve el nombre o None si no es válida."""
+    guardados = _procesar_y_guardar_imagenes([file], prefix=prefix, max_size=max_size, quality=quality)
+    return guardados[0] if guardados else None
+
+def _eliminar_imagen(filename):
+    """
+    Libera una referencia a la imagen. Si era la última, la elimina junto con sus
+    variantes del storage, de la caché local y del disco (legacy).
+    """
+    fila = ProductoImagen.query.filter_by(nombre=filename).with_for_update().first()
+    if fila and (fila.referencias or 1) > 1:
+        # Otra foto (u otro producto) sigue usando los mismos bytes
+        fila.referencias = fila.referencias - 1
+        return
+
+    nombres = nombres_relacionados(filename)
+    image_storage.eliminar(nombres)
+    # Caché y archivo legacy, como los bytes del storage, recién con el commit
+    al_confirmar(_descartar_copias, nombres, os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
+
+def _descartar_copias(nombres, path):
+    for nombre in nombres:
+        image_cache.invalidar(nombre)
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+    except Exception:
+        pass
 
 def _parse_fotos_from_form(fotos_raw):
     """Convierte texto (una por línea o separadas por coma) en lista de strings."""
@@ -285,14 +315,7 @@ def _guardar_fotos_subidas(request):
     Guarda los archivos subidos en request (name='fotos_nuevas') en la base de datos (ProductoImagen).
     Devuelve lista de nombres de archivo guardados.
     """
-    guardados = []
-    files = request.files.getlist('fotos_nuevas')
-    for f in files:
-        nombre = _procesar_y_guardar_imagen(f)
-        if nombre:
-            guardados.append(nombre)
-            
-    return guardados
+    return _procesar_y_guardar_imagenes(request.files.getlist('fotos_nuevas'))
 
 
 @admin_bp.route('/productos/nuevo', methods=['GET', 'POST'])
@@ -353,6 +376,7 @@ def admin_producto_nuevo():
         
         db.session.add(producto)
         db.session.commit()
+        suggest_index.actualizar_producto(producto)
         flash('Producto creado exitosamente', 'success')
         return redirect(url_for('admin.admin_productos'))
     
@@ -366,6 +390,7 @@ def admin_producto_editar(id):
     producto = Producto.query.get_or_404(id)
     
     if request.method == 'POST':
+        fotos_anteriores = producto.fotos_lista()
         producto.nombre = request.form.get('nombre', '').strip()
         categoria_id_form = request.form.get('categoria_id')
         producto.descripcion = request.form.get('descripcion', '').strip() or None
@@ -398,8 +423,15 @@ def admin_producto_editar(id):
         if not producto.nombre or not producto.categoria_id or producto.precio <= 0:
             flash('Completa nombre, categoría y precio válido', 'error')
             return redirect(url_for('admin.admin_producto_editar', id=id))
-        
+
+        # Las fotos que se sacaron en el formulario liberan su referencia (una por aparición)
+        quitadas = Counter(fotos_anteriores) - Counter(producto.fotos_lista())
+        for filename in quitadas.elements():
+            if not filename.startswith('http'):
+                _eliminar_imagen(filename)
+
         db.session.commit()
+        suggest_index.actualizar_producto(producto)
         flash('Producto actualizado exitosamente', 'success')
         return redirect(url_for('admin.admin_productos'))
     
@@ -422,13 +454,7 @@ def admin_producto_eliminar(id):
 
     # 2. Eliminar imágenes relacionadas de la DB y disco
     for filename in producto.fotos_lista():
-        ProductoImagen.query.filter_by(nombre=filename).delete()
-        try:
-            path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            if os.path.exists(path):
-                os.remove(path)
-        except Exception:
-            pass
+        _eliminar_imagen(filename)
 
     # 3. Eliminar reseñas relacionadas (manualmente para asegurar)
     Resena.query.filter_by(producto_id=id).delete()
@@ -436,6 +462,7 @@ def admin_producto_eliminar(id):
     # 4. Hard delete del producto
     db.session.delete(producto)
     db.session.commit()
+    suggest_index.quitar_producto(id)
     
     flash('Producto eliminado definitivamente', 'success')
     return redirect(url_for('admin.admin_productos'))
@@ -447,6 +474,7 @@ def admin_producto_activar(id):
     producto = Producto.query.get_or_404(id)
     producto.activo = True
     db.session.commit()
+    suggest_index.actualizar_producto(producto)
     flash('Producto activado exitosamente', 'success')
     return redirect(url_for('admin.admin_productos'))
 
@@ -459,6 +487,7 @@ def admin_producto_toggle_activo(id):
     if 'activo' in data:
         producto.activo = bool(data['activo'])
         db.session.commit()
+        suggest_index.actualizar_producto(producto)
         return jsonify({'ok': True, 'activo': producto.activo})
     return jsonify({'ok': False, 'error': 'Dato inválido'}), 400
 
@@ -513,16 +542,8 @@ def admin_producto_eliminar_foto(id):
         fotos.remove(filename)
         producto.fotos = fotos if fotos else None
         
-        # Eliminar de la tabla ProductoImagen (si existe)
-        ProductoImagen.query.filter_by(nombre=filename).delete()
-        
-        # Intentar borrar de disco si existe (para limpiar legacy)
-        try:
-            path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            if os.path.exists(path):
-                os.remove(path)
-        except Exception:
-            pass
+        # Eliminar de la tabla ProductoImagen (con sus variantes), de la caché y del disco (legacy)
+        _eliminar_imagen(filename)
             
         db.session.commit()
         return jsonify({'ok': True})
@@ -625,6 +646,7 @@ def admin_categoria_nueva():
     nueva = Categoria(nombre=nombre.capitalize(), activa=True)
     db.session.add(nueva)
     db.session.commit()
+    suggest_index.actualizar_categoria(nueva)
     
     flash('Categoría creada exitosamente', 'success')
     return redirect(url_for('admin.admin_categorias'))
@@ -635,6 +657,7 @@ def admin_categoria_toggle(id):
     categoria = Categoria.query.get_or_404(id)
     categoria.activa = not categoria.activa
     db.session.commit()
+    suggest_index.actualizar_categoria(categoria)
     
     estado = "activada" if categoria.activa else "desactivada"
     flash(f'Categoría {estado}', 'success')
@@ -658,6 +681,7 @@ def admin_categoria_editar(id):
         
     categoria.nombre = nuevo_nombre.capitalize()
     db.session.commit()
+    suggest_index.actualizar_categoria(categoria)
     
     flash('Categoría actualizada', 'success')
     return redirect(url_for('admin.admin_categorias'))
@@ -688,6 +712,7 @@ def admin_eliminar_categoria(id):
         
         db.session.delete(categoria)
         db.session.commit()
+        suggest_index.quitar_categoria(id)
         flash(f'Categoría "{categoria.nombre}" eliminada. {len(productos_a_migrar)} productos fueron actualizados.', 'success')
     except Exception as e:
         db.session.rollback()
@@ -757,10 +782,17 @@ def admin_productos_bulk_action():
             productos = Producto.query.filter(Producto.id.in_(product_ids)).all()
             for p in productos:
                 for filename in p.fotos_lista():
-                    ProductoImagen.query.filter_by(nombre=filename).delete()
+                    _eliminar_imagen(filename)
                 db.session.delete(p)
             
         db.session.commit()
+
+        if accion == 'activar':
+            for p in Producto.query.filter(Producto.id.in_(product_ids)).all():
+                suggest_index.actualizar_producto(p)
+        elif accion in ('desactivar', 'eliminar'):
+            for producto_id in product_ids:
+                suggest_index.quitar_producto(int(producto_id))
         return jsonify({'ok': True, 'mensaje': f'Acción "{accion}" aplicada a {len(product_ids)} productos.'})
     except Exception as e:
         db.session.rollback()
@@ -843,7 +875,7 @@ def admin_ventas_bulk_action():
 @admin_bp.route('/configuracion', methods=['GET', 'POST'])
 @login_required
 def admin_configuracion():
-    config = Configuracion.get_solo()
+    config = Configuracion.crear_si_falta()
     
     if request.method == 'POST':
         config.nombre_tienda = request.form.get('nombre_tienda')
@@ -859,14 +891,22 @@ def admin_configuracion():
         for i in range(1, 5):
             field_name = f'hero_image_{i}'
             file = request.files.get(field_name)
+            anterior = getattr(config, field_name)
+            reemplazada = False
             if file:
                 nombre_seguro = _procesar_y_guardar_imagen(file, prefix=f"hero_{i}_")
                 if nombre_seguro:
                     setattr(config, field_name, nombre_seguro)
+                    reemplazada = True
             
             # Check if user wants to remove the image (if we add a remove button later)
             if request.form.get(f'remove_{field_name}') == 'true':
                 setattr(config, field_name, None)
+                reemplazada = True
+
+            # La imagen anterior pierde su referencia
+            if anterior and reemplazada:
+                _eliminar_imagen(anterior)
         
         # FAQ
         config.envio_info = request.form.get('envio_info')
@@ -957,6 +997,7 @@ def admin_resenas():
 @login_required
 def admin_eliminar_resena(id):
     resena = Resena.query.get_or_404(id)
+    Producto.registrar_calificacion(resena.producto_id, resena.calificacion, -1)
     db.session.delete(resena)
     db.session.commit()
     flash('Reseña eliminada correctamente', 'success')
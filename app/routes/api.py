@@ -1,16 +1,25 @@
-from flask import Blueprint, jsonify, request, flash, redirect, url_for, send_file, send_from_directory, current_app
-from io import BytesIO
-from app.extensions import db
+from flask import Blueprint, jsonify, request, flash, redirect, url_for, send_file, send_from_directory, current_app, stream_with_context
+from datetime import datetime, timedelta
+import hashlib
+import re
+from app.extensions import db, image_cache, image_storage, suggest_index, query_cache
 from app.models import TipoEnvio, ProductoImagen, Producto, Resena, CuponDescuento
 from flask_login import login_required
+from sqlalchemy.orm import joinedload
+from app.services.image_service import VARIANTES, nombre_variante
+from app.services.checkout_service import CarritoInvalido, cantidades_carrito, cotizar
 
 api_bp = Blueprint('api', __name__)
 
 @api_bp.route("/envios", methods=["GET"])
 def api_envios():
     """Devuelve la lista de tipos de envío activos."""
-    tipos = TipoEnvio.query.filter_by(activo=True).all()
-    return jsonify([t.to_dict() for t in tipos])
+    tipos = query_cache.obtener(
+        'api_envios',
+        lambda: [t.to_dict() for t in TipoEnvio.query.filter_by(activo=True).all()],
+        tags=('TipoEnvio',)
+    )
+    return jsonify(tipos)
 
 @api_bp.route('/productos/<int:id>/resenas', methods=['POST'])
 def agregar_resena(id):
@@ -39,6 +48,7 @@ def agregar_resena(id):
     )
     
     db.session.add(nueva_resena)
+    Producto.registrar_calificacion(id, calificacion)
     db.session.commit()
     
     flash('¡Gracias por tu reseña!', 'success')
@@ -128,27 +138,178 @@ def api_producto_detalle(id):
     """
     return jsonify({"html": html})
 
+# Nombres generados al subir: uuid4 hex (con prefijo opcional hero_N_) -> contenido inmutable
+_NOMBRE_INMUTABLE = re.compile(r'^(hero_\d+_)?[0-9a-f]{32}\.[a-z0-9]+$')
+
+def _cache_control(filename):
+    if current_app.config.get('IMAGE_IMMUTABLE_CACHE') and _NOMBRE_INMUTABLE.match(filename):
+        return 'public, max-age=31536000, immutable' # 1 año
+    return 'public, max-age=604800' # 7 días
+
+def _no_modificada(etag, creado):
+    """True si el navegador ya tiene esta versión (If-None-Match / If-Modified-Since)."""
+    if request.if_none_match:
+        return bool(etag) and request.if_none_match.contains(etag)
+    if creado and request.if_modified_since:
+        return creado.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+def _respuesta_304(filename, etag, creado):
+    response = current_app.response_class(status=304)
+    if etag:
+        response.set_etag(etag)
+    if creado:
+        response.last_modified = creado
+    response.headers['Cache-Control'] = _cache_control(filename)
+    return response
+
+def _acepta_webp():
+    # Solo si el navegador lo pide explícitamente (un '*/*' no alcanza)
+    return any(valor == 'image/webp' and q > 0 for valor, q in request.accept_mimetypes)
+
+def _candidatos(filename, tamano, webp):
+    """Nombres a buscar, del preferido al original (las imágenes viejas no tienen variantes)."""
+    candidatos = []
+    if webp:
+        candidatos.append(nombre_variante(filename, tamano, 'webp'))
+    candidatos.append(nombre_variante(filename, tamano))
+    if filename not in candidatos:
+        candidatos.append(filename)
+    return candidatos
+
 @api_bp.route('/imagen_producto/<filename>')
 def imagen_producto(filename):
-    imagen = ProductoImagen.query.filter_by(nombre=filename).first()
     response = None
-    if imagen:
-        response = send_file(BytesIO(imagen.datos), mimetype=imagen.mimetype, as_attachment=False, download_name=imagen.nombre)
-    else:
-        try:
-            response = send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
-        except:
-            return "Imagen no encontrada", 404
+    provisoria = False
+    tamano = request.args.get('size')
+    if tamano not in VARIANTES:
+        tamano = None
+    negocia_webp = filename.lower().endswith(('.jpg', '.jpeg'))
+    candidatos = _candidatos(filename, tamano, negocia_webp and _acepta_webp())
+    # La caché se indexa por la variante pedida; si no existe se guarda ahí la mejor disponible
+    clave = candidatos[0]
+
+    # 1. Caché local en disco: no toca la base de datos
+    en_cache = image_cache.get(clave)
+    if en_cache:
+        ruta, meta = en_cache
+        etag = meta.get('etag')
+        creado = datetime.fromtimestamp(meta['creado']) if meta.get('creado') else None
+        if _no_modificada(etag, creado):
+            response = _respuesta_304(filename, etag, creado)
+        else:
+            try:
+                response = send_file(ruta, mimetype=meta.get('mimetype'), as_attachment=False, download_name=clave,
+                                     etag=etag or True, last_modified=creado)
+            except OSError:
+                # Desalojada por otro worker entre el get y el envío
+                response = None
+
+    # 2. Base de datos (y se guarda en caché para los próximos pedidos)
+    if response is None:
+        # Primero solo los metadatos: si el navegador ya la tiene, no se lee 'datos'
+        filas = db.session.query(
+            ProductoImagen.id, ProductoImagen.nombre, ProductoImagen.mimetype,
+            ProductoImagen.etag, ProductoImagen.creado, ProductoImagen.almacenamiento,
+            db.func.coalesce(ProductoImagen.tamano, db.func.length(ProductoImagen.datos)).label('tamano')
+        ).filter(ProductoImagen.nombre.in_(candidatos)).all()
+        imagen = min(filas, key=lambda f: candidatos.index(f.nombre)) if filas else None
+
+        if imagen:
+            etag, creado = imagen.etag, imagen.creado
+            # Subida recién: sus variantes se están generando en segundo plano. Se sirve
+            # el original sin guardarlo en caché ni marcarlo como inmutable.
+            provisoria = (imagen.nombre != clave and creado is not None
+                          and datetime.now() - creado < timedelta(minutes=5))
+            if _no_modificada(etag, creado):
+                response = _respuesta_304(filename, etag, creado)
+            else:
+                tamano_parte = current_app.config['IMAGE_STREAM_CHUNK_KB'] * 1024
+
+                def partes():
+                    return image_storage.partes(imagen, tamano_parte)
+
+                if not etag:
+                    # Imagen anterior a los ETags: se calcula una sola vez y queda guardado
+                    sha = hashlib.sha256()
+                    for parte in partes():
+                        sha.update(parte)
+                    etag = sha.hexdigest()
+                    ProductoImagen.query.filter_by(id=imagen.id).update({ProductoImagen.etag: etag})
+                    db.session.commit()
+
+                # Backend en disco local: se sirve el archivo directo, sin pasar por la caché
+                ruta_local = image_storage.ruta_local(imagen)
+                # Si no, se vuelca a la caché de a partes y se sirve desde el archivo (sendfile)
+                guardada = None if ruta_local or provisoria else image_cache.put_stream(
+                    clave, partes(), mimetype=imagen.mimetype, etag=etag,
+                    creado=creado.timestamp() if creado else None)
+                if ruta_local or guardada:
+                    response = send_file(ruta_local or guardada[0], mimetype=imagen.mimetype, as_attachment=False,
+                                         download_name=imagen.nombre, etag=etag, last_modified=creado)
+                else:
+                    # Sin caché: se transmite directo desde el storage, parte por parte
+                    response = current_app.response_class(stream_with_context(partes()), mimetype=imagen.mimetype)
+                    response.content_length = imagen.tamano
+                    response.set_etag(etag)
+                    response.last_modified = creado
+        else:
+            try:
+                response = send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+            except:
+                return "Imagen no encontrada", 404
             
     if response:
-        response.headers['Cache-Control'] = 'public, max-age=604800' # 7 días
+        response.headers['Cache-Control'] = 'no-cache' if provisoria else _cache_control(filename)
+        if negocia_webp:
+            response.vary.add('Accept')
     return response
 
 # --- API para obtener productos (para compatibilidad con JS) ---
 @api_bp.route('/productos')
 def api_productos():
-    productos = Producto.query.filter_by(activo=True).all()
-    return jsonify([p.to_dict() for p in productos])
+    productos = query_cache.obtener(
+        'api_productos',
+        lambda: [p.to_dict() for p in Producto.query.options(joinedload(Producto.categoria)).filter_by(activo=True).all()],
+        tags=('Producto', 'Categoria')
+    )
+    return jsonify(productos)
+
+# Un carrito real tiene unas pocas líneas; más que esto es abuso del endpoint
+MAX_LINEAS_COTIZACION = 100
+
+@api_bp.route('/carrito/cotizar', methods=['POST'])
+def cotizar_carrito():
+    """
+    Precios, stock y subtotales vigentes de los productos del carrito. Recibe
+    [{id, cantidad}] (o {"items": [...]}) y consulta solo esos productos: el
+    navegador ya no necesita bajar el catálogo entero para validar el stock.
+    """
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or len(items) > MAX_LINEAS_COTIZACION:
+        return jsonify({'ok': False, 'error': 'Carrito inválido'}), 400
+    if not items:
+        return jsonify({'ok': True, 'items': [], 'total': 0})
+    try:
+        cantidades = cantidades_carrito(items)
+    except CarritoInvalido as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+    return jsonify(dict(cotizar(cantidades), ok=True))
+
+@api_bp.route('/buscar/sugerencias')
+def buscar_sugerencias():
+    """Autocompletado del buscador: sale del índice en memoria, sin consultar la DB."""
+    texto = request.args.get('q', '').strip()[:100]
+    limite = min(request.args.get('limit', 8, type=int), 20)
+    sugerencias = []
+    for tipo, id, nombre in suggest_index.buscar(texto, limite):
+        if tipo == 'categoria':
+            url = url_for('main.productos', categoria=id)
+        else:
+            url = url_for('main.producto_detalle', id=id)
+        sugerencias.append({'tipo': tipo, 'id': id, 'nombre': nombre, 'url': url})
+    return jsonify(sugerencias)
 
 @api_bp.route('/validar-cupon', methods=['POST'])
 def validar_cupon():
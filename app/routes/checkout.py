@@ -1,11 +1,60 @@
+from uuid import uuid4
 from flask import Blueprint, render_template, request, flash, redirect, url_for, json, current_app
+from sqlalchemy.exc import IntegrityError
 from app.extensions import db
-from app.models import Producto, Pedido, DetallePedido, CuponDescuento, Configuracion
+from app.models import Pedido, CuponDescuento, Configuracion
 from app.services.email_service import enviar_emails_checkout, enviar_mail_confirmacion_pago
 from app.services.payment_service import PaymentService
+from app.services.checkout_service import (CarritoInvalido, al_confirmar, cantidades_carrito, crear_pedido,
+                                           normalizar_clave, recordar_resultado, reservar_stock,
+                                           resultado_previo)
+from app.services.cache_service import instantanea
 
 checkout_bp = Blueprint('checkout', __name__)
 
+DATOS_VENDEDOR = {
+    "banco": "Mercado Pago",
+    "alias": "ESTILO.FACHERO",
+    "titular": "Yamila Luciana Serrano"
+}
+
+
+def _preferencia_mp(pedido, carrito, envio_precio, envio_nombre):
+    """URL de pago de Mercado Pago para el pedido (None si falló)."""
+    payment_service = PaymentService(current_app.config['MERCADOPAGO_ACCESS_TOKEN'])
+    return payment_service.create_preference(
+        pedido=pedido,
+        carrito=carrito,
+        envio_precio=envio_precio,
+        envio_nombre=envio_nombre,
+        success_url=url_for('checkout.mp_success', _external=True, _scheme='https'),
+        failure_url=url_for('checkout.mp_failure', _external=True, _scheme='https'),
+        pending_url=url_for('checkout.mp_pending', _external=True, _scheme='https')
+    )
+
+
+def _responder_mp(init_point):
+    if init_point:
+        return redirect(init_point)
+    flash("Hubo un error al conectar con Mercado Pago. Intentá de nuevo o elegí transferencia.", "error")
+    return redirect(url_for('main.cart'))
+
+
+def _repetir_resultado(previo, clave, envio_precio, envio_nombre):
+    """Respuesta a un envío repetido del formulario: la misma que recibió el primero."""
+    if previo['metodo_pago'] == 'mercadopago':
+        init_point = previo['init_point']
+        if not init_point:
+            # La URL ya no está en la caché (otro worker o venció): se pide otra para el mismo pedido,
+            # con los precios que quedaron guardados en sus detalles
+            pedido = db.session.get(Pedido, previo['pedido_id'])
+            items = [{'id': d.producto_id, 'nombre': d.nombre_producto, 'cantidad': d.cantidad,
+                      'precio': d.precio_unitario} for d in pedido.detalles]
+            init_point = _preferencia_mp(instantanea(pedido), items, envio_precio, envio_nombre)
+            recordar_resultado(clave, previo['pedido_id'], previo['total'], previo['metodo_pago'], init_point)
+        return _responder_mp(init_point)
+    return render_template('success.html', datos=DATOS_VENDEDOR, total=previo['total'])
+
 @checkout_bp.route('/finalizar', methods=['GET', 'POST'])
 def checkout():
     config = Configuracion.get_solo()
@@ -35,39 +84,32 @@ def checkout():
         except:
             carrito = []
 
-        # --- VALIDACIÓN DE STOCK ---
-        for item in carrito:
-            try:
-                pid = int(item.get("id"))
-                cant_pedida = int(item.get("cantidad", 1))
-            except Exception:
-                return render_template('checkout.html')
-            
-            producto = db.session.get(Producto, pid)
-            if not producto or not producto.activo:
-                flash(f'El producto "{item.get("nombre", "")}" no está disponible.', 'error')
-                return redirect(url_for('main.cart'))
-            
-            if producto.stock < cant_pedida:
-                flash(f'Stock insuficiente de "{producto.nombre}". Disponibles: {producto.stock}', 'error')
-                return redirect(url_for('main.cart'))
-
-        # --- DEDUCIR STOCK ---
-        for item in carrito:
-            try:
-                pid = int(item.get("id"))
-                cant_pedida = int(item.get("cantidad", 1))
-            except Exception:
-                continue
-            
-            producto = db.session.get(Producto, pid)
-            if producto:
-                producto.stock -= cant_pedida
-        
-        db.session.commit()
-        
-        
-        total_productos = sum(item['precio'] * item['cantidad'] for item in carrito)
+        # --- ENVÍO REPETIDO (doble click / reintento) ---
+        clave = normalizar_clave(request.form.get('clave_idempotencia'))
+        previo = resultado_previo(clave)
+        if previo:
+            return _repetir_resultado(previo, clave, envio_precio, envio_nombre)
+
+        # --- VALIDACIÓN Y DESCUENTO DE STOCK ---
+        # Se bloquean los productos del carrito y el stock se descuenta en la misma
+        # transacción que crea el pedido: si algo falla no queda stock descontado.
+        # Del navegador solo se usan ids y cantidades: los precios salen de la base.
+        try:
+            cantidades = cantidades_carrito(carrito)
+            cotizado = reservar_stock(cantidades, nombres={
+                int(item['id']): item.get('nombre', '') for item in carrito
+            })
+        except CarritoInvalido as e:
+            db.session.rollback()
+            # Si el mismo formulario se mandó dos veces a la vez, el primero pudo llevarse el stock
+            previo = resultado_previo(clave)
+            if previo:
+                return _repetir_resultado(previo, clave, envio_precio, envio_nombre)
+            flash(str(e), 'error')
+            return redirect(url_for('main.cart'))
+
+        items = cotizado['items']
+        total_productos = cotizado['total']
         
         # --- VALIDACIÓN DE CUPÓN ---
         if cupon_codigo:
@@ -80,7 +122,6 @@ def checkout():
         total_productos = (total_productos - descuento_monto)
         
         # --- DESCUENTO POR TRANSFERENCIA (Dinámico) ---
-        config = Configuracion.get_solo()
         descuento_transferencia = 0.0
         pct_descuento = config.descuento_transferencia or 0.0
         
@@ -91,62 +132,56 @@ def checkout():
         total = total_productos + envio_precio
 
         # --- GUARDAR PEDIDO EN BASE DE DATOS ---
-        pedido = Pedido(
-            nombre_cliente=nombre,
-            email_cliente=email_cliente,
-            telefono_cliente=telefono_cliente,
-            direccion_cliente=direccion_cliente,
-            cp_cliente=cp_cliente,
-            envio_tipo=envio_tipo,
-            envio_nombre=envio_nombre,
-            envio_precio=envio_precio,
-            total_productos=total_productos,
-            total=total,
-            metodo_pago=metodo_pago,
-            cupon_codigo=cupon_codigo,
-            descuento_monto=descuento_monto
-        )
-        
-        for item in carrito:
-            detalle = DetallePedido(
-                producto_id=item.get('id'),
-                nombre_producto=item.get('nombre'),
-                cantidad=item.get('cantidad', 1),
-                precio_unitario=item.get('precio')
-            )
-            pedido.detalles.append(detalle)
-        
-        db.session.add(pedido)
-        db.session.commit()
+        # Stock, pedido y detalles van en una sola transacción (un solo commit)
+        try:
+            pedido = crear_pedido({
+                'nombre_cliente': nombre,
+                'email_cliente': email_cliente,
+                'telefono_cliente': telefono_cliente,
+                'direccion_cliente': direccion_cliente,
+                'cp_cliente': cp_cliente,
+                'envio_tipo': envio_tipo,
+                'envio_nombre': envio_nombre,
+                'envio_precio': envio_precio,
+                'total_productos': total_productos,
+                'total': total,
+                'metodo_pago': metodo_pago,
+                'cupon_codigo': cupon_codigo,
+                'descuento_monto': descuento_monto,
+                'clave_idempotencia': clave,
+            }, [{
+                'producto_id': item['id'],
+                'nombre_producto': item['nombre'],
+                'cantidad': item['cantidad'],
+                'precio_unitario': item['precio'],
+            } for item in items])
+        except IntegrityError:
+            # Otro envío con la misma clave ya creó el pedido (índice único)
+            db.session.rollback()
+            previo = resultado_previo(clave)
+            if previo:
+                return _repetir_resultado(previo, clave, envio_precio, envio_nombre)
+            raise
+        # Los efectos externos usan una copia: después del commit el pedido queda expirado
+        pedido_datos = instantanea(pedido)
 
         # --- MERCADO PAGO ---
         if metodo_pago == 'mercadopago':
-            payment_service = PaymentService(current_app.config['MERCADOPAGO_ACCESS_TOKEN'])
-            init_point = payment_service.create_preference(
-                pedido=pedido,
-                carrito=carrito,
-                envio_precio=envio_precio,
-                envio_nombre=envio_nombre,
-                success_url=url_for('checkout.mp_success', _external=True, _scheme='https'),
-                failure_url=url_for('checkout.mp_failure', _external=True, _scheme='https'),
-                pending_url=url_for('checkout.mp_pending', _external=True, _scheme='https')
-            )
-            
-            if init_point:
-                return redirect(init_point)
-            else:
-                flash("Hubo un error al conectar con Mercado Pago. Intentá de nuevo o elegí transferencia.", "error")
-                return redirect(url_for('main.cart'))
+            preferencia = {}
+
+            def _crear_preferencia():
+                preferencia['init_point'] = _preferencia_mp(pedido_datos, items, envio_precio, envio_nombre)
 
-        datos_vendedor = {
-            "banco": "Mercado Pago",
-            "alias": "ESTILO.FACHERO",
-            "titular": "Yamila Luciana Serrano"
-        }
+            al_confirmar(_crear_preferencia)
+            db.session.commit()
+            recordar_resultado(clave, pedido_datos.id, total, metodo_pago, preferencia.get('init_point'))
+            return _responder_mp(preferencia.get('init_point'))
+
+        datos_vendedor = DATOS_VENDEDOR
 
         filas_carrito = ""
-        for item in carrito:
-            subtotal = item['precio'] * item['cantidad']
+        for item in items:
+            subtotal = item['subtotal']
             filas_carrito += f"""
                 <tr>
                     <td style='padding:8px 12px;border-bottom:1px solid #eee;'>{item['nombre']}</td>
@@ -175,12 +210,16 @@ def checkout():
                 </tr>
             """
 
-        # --- ENVÍO DE MAILS EN SEGUNDO PLANO ---
-        enviar_emails_checkout(
+        # --- ENVÍO DE MAILS EN SEGUNDO PLANO (solo si el pedido se guardó) ---
+        al_confirmar(
+            enviar_emails_checkout,
             nombre, email_cliente, telefono_cliente, direccion_cliente, cp_cliente, 
             envio_nombre, envio_tipo_label, envio_precio, total, 
-            filas_carrito, fila_envio_html, datos_vendedor
+            filas_carrito, fila_envio_html, datos_vendedor,
+            whatsapp=(config.whatsapp_numero, config.whatsapp_link)
         )
+        db.session.commit()
+        recordar_resultado(clave, pedido_datos.id, total, metodo_pago)
 
         return render_template(
             'success.html',
@@ -188,7 +227,7 @@ def checkout():
             total=total,
         )
 
-    return render_template('checkout.html', config=config)
+    return render_template('checkout.html', config=config, clave_idempotencia=uuid4().hex)
 
 # --- RUTAS RETORNO MERCADO PAGO ---
 @checkout_bp.route('/mp/success')
@@ -203,19 +242,19 @@ def mp_success():
     if not pedido:
         return redirect(url_for('main.home'))
         
+    total = pedido.total
     # Actualizar pedido
     if not pedido.pagado:
         pedido.pagado = True
         pedido.estado = 'Aprobado'
-        db.session.commit()
-        
         url_script = current_app.config['GOOGLE_APPS_SCRIPT_URL']
         token = current_app.config['EMAIL_WEBHOOK_TOKEN']
-        enviar_mail_confirmacion_pago(pedido, payment_id, url_script, token)
+        al_confirmar(enviar_mail_confirmacion_pago, instantanea(pedido), payment_id, url_script, token)
+        db.session.commit()
 
     return render_template('success.html', 
                          datos={"banco": "Mercado Pago", "alias": "-", "titular": "-"}, 
-                         total=pedido.total,
+                         total=total,
                          pagado=True,
                          payment_id=payment_id,
                          whatsapp_link=current_app.config['WHATSAPP_LINK'],
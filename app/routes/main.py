@@ -1,5 +1,8 @@
 from flask import Blueprint, render_template, request
 from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from app.extensions import db, search_index
+from app.services.pagination import paginar
 from app.models import Producto, Categoria, TIPOS_PRODUCTO
 
 main_bp = Blueprint('main', __name__)
@@ -19,9 +22,10 @@ def productos():
     tipo_filtro = request.args.get('tipo', '').strip().lower()
     
     busqueda = request.args.get('q', '').strip()
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     
-    query = Producto.query.filter_by(activo=True)
+    # La categoría viene en el mismo SELECT (el template muestra su nombre en cada tarjeta)
+    query = Producto.query.options(joinedload(Producto.categoria)).filter_by(activo=True)
     
     # Filtro por ID de categoría
     if categoria_id:
@@ -30,21 +34,26 @@ def productos():
     elif tipo_filtro:
         query = query.join(Categoria).filter(func.lower(Categoria.nombre) == tipo_filtro)
     
+    relevancia = None
     if busqueda:
-        query = query.filter(
-            (Producto.nombre.ilike(f'%{busqueda}%')) | 
-            (Producto.descripcion.ilike(f'%{busqueda}%'))
-        )
+        query, relevancia = search_index.filtrar(query, busqueda)
     
-    sort = request.args.get('sort', 'newest')
-    if sort == 'price_low':
-        query = query.order_by(Producto.precio.asc())
+    # Con búsqueda, por defecto se ordena por relevancia. El orden siempre termina
+    # en el id: es la clave del cursor de paginación
+    sort = request.args.get('sort') or ('relevance' if busqueda else 'newest')
+    if sort == 'relevance' and relevancia is not None:
+        orden = [relevancia, (Producto.id, 'desc')]
+    elif sort == 'price_low':
+        orden = [(Producto.precio, 'asc'), (Producto.id, 'asc')]
     elif sort == 'price_high':
-        query = query.order_by(Producto.precio.desc())
+        orden = [(Producto.precio, 'desc'), (Producto.id, 'desc')]
+    elif sort == 'rating':
+        promedio = func.coalesce(db.cast(Producto.rating_sum, db.Float) / func.nullif(Producto.rating_count, 0), 0.0)
+        orden = [(promedio, 'desc'), (Producto.rating_count, 'desc'), (Producto.id, 'desc')]
     else:
-        query = query.order_by(Producto.id.desc())
+        orden = [(Producto.id, 'desc')]
         
-    pagination = query.paginate(page=page, per_page=12, error_out=False)
+    pagination = paginar(query, orden, cursor=cursor, per_page=12, tags=('Producto', 'Categoria'))
     
     # Traer categorías activas para los filtros
     categorias = Categoria.query.filter_by(activa=True).order_by(Categoria.nombre).all()
@@ -0,0 +1,206 @@
+import pickle
+import threading
+import time
+from types import SimpleNamespace
+from sqlalchemy import event
+
+try:
+    import redis
+except ImportError:  # Solo hace falta con CACHE_BACKEND=redis
+    redis = None
+
+# Categorías activas + configuración de la tienda que usan todos los templates
+CLAVE_GLOBALES = 'globales'
+
+
+def instantanea(obj):
+    """
+    Copia de las columnas de un modelo en un SimpleNamespace: se puede guardar en
+    caché y usar desde cualquier request sin depender de la sesión de SQLAlchemy.
+    """
+    if obj is None:
+        return None
+    return SimpleNamespace(**{c.key: getattr(obj, c.key) for c in obj.__table__.columns})
+
+
+class BackendLocal:
+    """Memoria del proceso: cada worker tiene la suya."""
+    nombre = 'local'
+
+    def __init__(self):
+        self._datos = {}
+        self._versiones = {}
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        entrada = self._datos.get(clave)
+        if entrada and entrada[0] > time.monotonic():
+            return entrada[1]
+        return None
+
+    def set(self, clave, valor, ttl):
+        with self._lock:
+            # Las claves viejas (de versiones de tags anteriores) se limpian de paso
+            ahora = time.monotonic()
+            if len(self._datos) > 1000:
+                self._datos = {k: v for k, v in self._datos.items() if v[0] > ahora}
+            self._datos[clave] = (ahora + ttl, valor)
+
+    def delete(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def versiones(self, tags):
+        return [self._versiones.get(tag, 0) for tag in tags]
+
+    def incrementar(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._versiones[tag] = self._versiones.get(tag, 0) + 1
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+class BackendRedis:
+    """
+    Redis (o compatible: Valkey, KeyDB...) compartido por todos los workers: una
+    invalidación se ve en todos al instante. Para probarlo alcanza con un
+    'redis-server' local y CACHE_REDIS_URL=redis://localhost:6379/0.
+    """
+    nombre = 'redis'
+
+    def __init__(self, url, prefijo='ef:'):
+        if redis is None:
+            raise RuntimeError("CACHE_BACKEND='redis' requiere el paquete redis (pip install redis).")
+        self.cliente = redis.Redis.from_url(url)
+        self.prefijo = prefijo
+
+    def get(self, clave):
+        datos = self.cliente.get(self.prefijo + clave)
+        return pickle.loads(datos) if datos is not None else None
+
+    def set(self, clave, valor, ttl):
+        self.cliente.set(self.prefijo + clave, pickle.dumps(valor), ex=max(1, int(ttl)))
+
+    def delete(self, clave):
+        self.cliente.delete(self.prefijo + clave)
+
+    def versiones(self, tags):
+        if not tags:
+            return []
+        return [int(v or 0) for v in self.cliente.mget([f"{self.prefijo}tag:{t}" for t in tags])]
+
+    def incrementar(self, tags):
+        pipe = self.cliente.pipeline()
+        for tag in tags:
+            pipe.incr(f"{self.prefijo}tag:{tag}")
+        pipe.execute()
+
+    def limpiar(self):
+        for clave in self.cliente.scan_iter(match=f"{self.prefijo}*"):
+            self.cliente.delete(clave)
+
+
+class QueryCache:
+    """
+    Caché de resultados de consultas con tags por modelo.
+
+    Cada resultado se guarda etiquetado con los modelos de los que depende
+    ('Producto', 'Categoria', 'TipoEnvio', 'Configuracion'...). La clave real
+    incluye la versión actual de cada tag; cuando se confirma una transacción que
+    tocó uno de esos modelos (after_flush para cambios del ORM, do_orm_execute
+    para UPDATE/DELETE masivos, after_commit para aplicar) se incrementa la versión
+    y las entradas viejas quedan inalcanzables hasta que vence su TTL.
+
+    Con CACHE_BACKEND='local' la invalidación solo se ve en el worker que hizo el
+    cambio (los demás esperan el TTL); con 'redis' la ven todos.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 60
+        self.backend = BackendLocal()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from sqlalchemy.orm import Session
+
+        self.ttl = app.config.get('CACHE_TTL', 60)
+        if app.config.get('CACHE_BACKEND', 'local') == 'redis':
+            self.backend = BackendRedis(app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+                                        app.config.get('CACHE_REDIS_PREFIX', 'ef:'))
+        else:
+            self.backend = BackendLocal()
+
+        for nombre, funcion in (('after_flush', self._after_flush), ('do_orm_execute', self._do_orm_execute),
+                                ('after_commit', self._after_commit), ('after_rollback', self._after_rollback)):
+            if not event.contains(Session, nombre, funcion):
+                event.listen(Session, nombre, funcion)
+        app.extensions['query_cache'] = self
+
+    def _clave(self, clave, tags):
+        versiones = self.backend.versiones(tags)
+        return clave + ''.join(f"|{tag}:{v}" for tag, v in zip(tags, versiones))
+
+    def obtener(self, clave, cargar, tags=(), ttl=None):
+        """
+        Valor en caché, o el resultado de cargar() (que se guarda) si no está, venció
+        o alguno de sus tags cambió. Si el backend falla se llama a cargar() directo.
+        """
+        tags = tuple(sorted(tags))
+        try:
+            clave_real = self._clave(clave, tags)
+            valor = self.backend.get(clave_real)
+            if valor is not None:
+                return valor
+        except Exception as e:
+            print(f"Error leyendo caché ({clave}): {e}")
+            return cargar()
+
+        valor = cargar()
+        try:
+            self.backend.set(clave_real, valor, self.ttl if ttl is None else ttl)
+        except Exception as e:
+            print(f"Error guardando caché ({clave}): {e}")
+        return valor
+
+    def guardar(self, clave, valor, ttl=None):
+        """Guarda un valor sin tags (lo lee obtener() con la misma clave y sin tags)."""
+        try:
+            self.backend.set(clave, valor, self.ttl if ttl is None else ttl)
+        except Exception as e:
+            print(f"Error guardando caché ({clave}): {e}")
+
+    def invalidar_tags(self, *tags):
+        try:
+            self.backend.incrementar(sorted(set(tags)))
+        except Exception as e:
+            print(f"Error invalidando caché {tags}: {e}")
+
+    def limpiar(self):
+        self.backend.limpiar()
+
+    # --- Eventos de SQLAlchemy ---
+
+    @staticmethod
+    def _tags_pendientes(session):
+        return session.info.setdefault('cache_tags', set())
+
+    def _after_flush(self, session, flush_context):
+        tags = self._tags_pendientes(session)
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            tags.add(type(obj).__name__)
+
+    def _do_orm_execute(self, orm_execute_state):
+        if (orm_execute_state.is_update or orm_execute_state.is_delete) and orm_execute_state.bind_mapper:
+            self._tags_pendientes(orm_execute_state.session).add(orm_execute_state.bind_mapper.class_.__name__)
+
+    def _after_commit(self, session):
+        tags = session.info.pop('cache_tags', None)
+        if tags:
+            self.invalidar_tags(*tags)
+
+    def _after_rollback(self, session):
+        session.info.pop('cache_tags', None)
@@ -0,0 +1,224 @@
+import re
+from sqlalchemy import case, event, insert, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from app.extensions import db, query_cache
+from app.models import Producto, Pedido, DetallePedido
+
+# Claves de idempotencia: las genera el formulario (uuid4().hex)
+_CLAVE_VALIDA = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+# Ids y cantidades tienen que entrar en un INTEGER de la base
+_ENTERO_MAXIMO = 2 ** 31 - 1
+# Cuánto se recuerda el resultado de un checkout (después queda la búsqueda por clave en la base)
+TTL_RESULTADO = 600
+
+
+class CarritoInvalido(ValueError):
+    """El carrito no se puede comprar tal cual; el mensaje es para mostrarle al cliente."""
+
+
+def cantidades_carrito(carrito):
+    """
+    {producto_id: cantidad} a partir del carrito que manda el navegador. Un
+    producto repetido en varias líneas se suma: así se valida contra el stock
+    una sola vez y con la cantidad real.
+    """
+    # carrito_data es JSON del navegador: puede llegar null, un objeto o cualquier cosa
+    if not isinstance(carrito, list):
+        raise CarritoInvalido('El carrito tiene un formato inválido.')
+    cantidades = {}
+    for item in carrito:
+        try:
+            pid = int(item.get('id'))
+            cantidad = int(item.get('cantidad', 1))
+        except (TypeError, ValueError, AttributeError, OverflowError):
+            raise CarritoInvalido('El carrito tiene un producto inválido.')
+        if not 1 <= pid <= _ENTERO_MAXIMO:
+            raise CarritoInvalido('El carrito tiene un producto inválido.')
+        # El límite va sobre la suma: líneas repetidas también tienen que entrar en un INTEGER
+        cantidades[pid] = cantidades.get(pid, 0) + cantidad
+        if cantidad < 1 or cantidades[pid] > _ENTERO_MAXIMO:
+            raise CarritoInvalido(f'Cantidad inválida para "{item.get("nombre", "")}".')
+    if not cantidades:
+        raise CarritoInvalido('El carrito está vacío.')
+    return cantidades
+
+
+def cotizacion(productos, cantidades):
+    """
+    Precios del carrito según la base, nunca los que manda el navegador.
+    'productos' es {producto_id: fila con id, nombre, precio, stock y activo}
+    (objetos Producto o filas de una consulta). Devuelve {'items': [...],
+    'total': ...}: una línea por producto con precio, stock, si se puede comprar
+    esa cantidad y el subtotal. Los no disponibles no suman al total.
+    """
+    items = []
+    total = 0.0
+    for pid, cantidad in cantidades.items():
+        producto = productos.get(pid)
+        if producto is None or not producto.activo:
+            items.append({'id': pid, 'nombre': producto.nombre if producto else None, 'precio': None,
+                          'cantidad': cantidad, 'stock': 0, 'disponible': False, 'subtotal': 0.0})
+            continue
+        precio = float(producto.precio)
+        stock = producto.stock or 0
+        disponible = stock >= cantidad
+        subtotal = precio * cantidad if disponible else 0.0
+        total += subtotal
+        items.append({'id': pid, 'nombre': producto.nombre, 'precio': precio, 'cantidad': cantidad,
+                      'stock': stock, 'disponible': disponible, 'subtotal': subtotal})
+    return {'items': items, 'total': total}
+
+
+def cotizar(cantidades):
+    """
+    Cotización de un carrito ({producto_id: cantidad}) con una sola consulta y
+    solo las columnas que hacen falta. Es lo que consulta el navegador; el
+    checkout usa cotizacion() con los productos que ya bloqueó.
+    """
+    filas = db.session.query(Producto.id, Producto.nombre, Producto.precio, Producto.stock, Producto.activo) \
+        .filter(Producto.id.in_(list(cantidades)))
+    return cotizacion({f.id: f for f in filas}, cantidades)
+
+
+def reservar_stock(cantidades, nombres=None):
+    """
+    Valida y descuenta el stock de todo el carrito en la transacción actual
+    (el commit lo hace quien crea el pedido). Son dos consultas sin importar
+    cuántos productos haya:
+
+    - SELECT ... FOR UPDATE de todos los productos, ordenados por id: las
+      filas quedan bloqueadas hasta el commit y, como todos los checkouts las
+      bloquean en el mismo orden, dos carritos con productos en común no se
+      traban entre sí (deadlock).
+    - Un UPDATE con 'stock >= cantidad' en el WHERE que descuenta todo junto.
+      Si afecta menos filas que productos, alguien compró en el medio (en
+      SQLite FOR UPDATE no existe y esta es la única garantía) y no se vende
+      de más.
+
+    Devuelve la cotización del carrito (ver cotizacion()): sus precios son los
+    que se cobran.
+    """
+    nombres = nombres or {}
+    ids = sorted(cantidades)
+    productos = {p.id: p for p in Producto.query.filter(Producto.id.in_(ids))
+                 .order_by(Producto.id).with_for_update().populate_existing()}
+
+    # Se cotiza antes de descontar: los precios que se cobran son los de las filas bloqueadas
+    cotizado = cotizacion(productos, cantidades)
+    for item in cotizado['items']:
+        if item['precio'] is None:
+            nombre = item['nombre'] or nombres.get(item['id'], '')
+            raise CarritoInvalido(f'El producto "{nombre}" no está disponible.')
+        if not item['disponible']:
+            raise CarritoInvalido(f'Stock insuficiente de "{item["nombre"]}". Disponibles: {item["stock"]}')
+
+    cantidad = case(cantidades, value=Producto.id)
+    resultado = db.session.execute(
+        update(Producto)
+        .where(Producto.id.in_(ids), Producto.stock >= cantidad)
+        .values(stock=Producto.stock - cantidad)
+        .execution_options(synchronize_session=False)
+    )
+    if resultado.rowcount != len(ids):
+        raise CarritoInvalido('El stock cambió mientras comprabas. Revisá el carrito e intentá de nuevo.')
+
+    # Reflejar el descuento en los objetos sin marcarlos como modificados (ya se hizo el UPDATE)
+    for pid, producto in productos.items():
+        set_committed_value(producto, 'stock', producto.stock - cantidades[pid])
+    return cotizado
+
+
+def crear_pedido(datos, detalles):
+    """
+    Inserta el pedido y sus detalles en la transacción actual: un INSERT para
+    el pedido (para conocer su id) y uno solo, con todas las filas, para los
+    detalles. 'datos' son las columnas del pedido y 'detalles' una lista de
+    dicts con producto_id, nombre_producto, cantidad y precio_unitario.
+    """
+    pedido = Pedido(**datos)
+    db.session.add(pedido)
+    db.session.flush()
+    db.session.execute(insert(DetallePedido), [dict(d, pedido_id=pedido.id) for d in detalles])
+    return pedido
+
+
+# --- Idempotencia ---
+# Un doble click o un reintento del navegador manda el mismo formulario dos
+# veces. Cada formulario trae una clave única que se guarda en el pedido
+# (índice único): un envío repetido devuelve el resultado del primero en vez de
+# volver a descontar stock, crear otro pedido y mandar otros mails.
+
+def normalizar_clave(clave):
+    """La clave del formulario, o None si no vino o no tiene el formato esperado."""
+    clave = (clave or '').strip()
+    return clave if _CLAVE_VALIDA.match(clave) else None
+
+
+def resultado_previo(clave):
+    """
+    {'pedido_id', 'total', 'metodo_pago', 'init_point'} del checkout ya hecho con
+    esta clave, o None. Primero se busca en la caché (que además tiene la URL de
+    Mercado Pago) y si no está, el pedido por su clave única.
+    """
+    if not clave:
+        return None
+
+    def cargar():
+        pedido = Pedido.query.filter_by(clave_idempotencia=clave).first()
+        if pedido is None:
+            return None
+        return {'pedido_id': pedido.id, 'total': pedido.total,
+                'metodo_pago': pedido.metodo_pago, 'init_point': None}
+
+    return query_cache.obtener(f'checkout:{clave}', cargar, ttl=TTL_RESULTADO)
+
+
+def recordar_resultado(clave, pedido_id, total, metodo_pago, init_point=None):
+    if clave:
+        query_cache.guardar(f'checkout:{clave}', {'pedido_id': pedido_id, 'total': total,
+                                                  'metodo_pago': metodo_pago, 'init_point': init_point},
+                            ttl=TTL_RESULTADO)
+
+
+# --- Efectos posteriores al commit ---
+# Mails, Mercado Pago y cualquier llamada externa del checkout se registran con
+# al_confirmar() y se ejecutan solo si la transacción se confirma, después de
+# devolver la conexión al pool (no la retienen mientras esperan la red).
+# al_revertir() es lo contrario: deshace efectos ya hechos fuera de la base
+# (bytes de imágenes escritos) si la transacción termina sin commit.
+
+def al_confirmar(funcion, *args, **kwargs):
+    """Ejecuta funcion(*args, **kwargs) después del commit de la sesión actual (nunca si hay rollback)."""
+    db.session.info.setdefault('al_confirmar', []).append((funcion, args, kwargs))
+
+
+def al_revertir(funcion, *args, **kwargs):
+    """Ejecuta funcion(*args, **kwargs) si la transacción actual termina sin commit (nunca si se confirma)."""
+    db.session.info.setdefault('al_revertir', []).append((funcion, args, kwargs))
+
+
+def _after_commit(session):
+    session.info.pop('al_revertir', None)
+    pendientes = session.info.pop('al_confirmar', None)
+    if pendientes:
+        session.info.setdefault('confirmados', []).extend(pendientes)
+
+
+def _after_transaction_end(session, transaction):
+    # after_commit corre con la conexión todavía tomada; acá ya se liberó
+    if transaction.parent is not None:
+        return
+    # Lo que quedó sin confirmar es de una transacción que terminó en rollback
+    session.info.pop('al_confirmar', None)
+    for momento, clave in (('del commit', 'confirmados'), ('del rollback', 'al_revertir')):
+        for funcion, args, kwargs in session.info.pop(clave, None) or ():
+            try:
+                funcion(*args, **kwargs)
+            except Exception as e:
+                print(f"Error ejecutando {getattr(funcion, '__name__', funcion)} después {momento}: {e}")
+
+
+for _nombre, _funcion in (('after_commit', _after_commit), ('after_transaction_end', _after_transaction_end)):
+    if not event.contains(Session, _nombre, _funcion):
+        event.listen(Session, _nombre, _funcion)
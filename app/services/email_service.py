@@ -4,7 +4,12 @@ from flask import current_app
 
 def enviar_emails_checkout(nombre, email_cliente, telefono_cliente, direccion_cliente, cp_cliente, 
                           envio_nombre, envio_tipo_label, envio_precio, total, 
-                          filas_carrito, fila_envio_html, datos_vendedor):
+                          filas_carrito, fila_envio_html, datos_vendedor, whatsapp=None):
+    """
+    Mails de confirmación al cliente y al vendedor. 'whatsapp' es (numero, link)
+    ya leídos de la configuración: el checkout llama a esta función después del
+    commit y así no vuelve a consultar la base.
+    """
     
     google_script_url = current_app.config.get('GOOGLE_APPS_SCRIPT_URL')
     token = current_app.config.get('EMAIL_WEBHOOK_TOKEN')
@@ -13,13 +18,12 @@ def enviar_emails_checkout(nombre, email_cliente, telefono_cliente, direccion_cl
     whatsapp_link = current_app.config.get('WHATSAPP_LINK')
 
     # Intentar obtener config de la base de datos para datos NO sensibles
-    from app.models import Configuracion
-    config_db = Configuracion.get_solo()
-    if config_db:
-        if config_db.whatsapp_numero:
-            whatsapp_numero = config_db.whatsapp_numero
-        if config_db.whatsapp_link:
-            whatsapp_link = config_db.whatsapp_link
+    if whatsapp is None:
+        from app.models import Configuracion
+        config_db = Configuracion.get_solo()
+        whatsapp = (config_db.whatsapp_numero, config_db.whatsapp_link) if config_db else (None, None)
+    whatsapp_numero = whatsapp[0] or whatsapp_numero
+    whatsapp_link = whatsapp[1] or whatsapp_link
 
     try:
         # -------- Mail para el cliente con instrucciones de pago (HTML) --------
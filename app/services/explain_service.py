@@ -0,0 +1,122 @@
+from datetime import datetime
+from app.extensions import db, search_index
+from app.services.search_service import tokenizar
+from app.models import Producto, Pedido, DetallePedido, Resena
+
+# Tablas grandes: un recorrido secuencial sobre ellas en una consulta clave es un error
+TABLAS_VIGILADAS = {'productos', 'pedidos', 'detalles_pedido', 'resenas'}
+
+
+def consultas_clave():
+    """Las consultas calientes de main.py y admin.py, con valores de ejemplo."""
+    # Búsqueda del catálogo por el mismo camino que main.productos (search_index.filtrar
+    # y el mismo orden), con una palabra de un producto real para que encuentre algo:
+    # en Postgres es el tsvector (índice GIN) y sin él, los ids del índice en memoria
+    # buscados por clave primaria. Sin productos activos no hay búsqueda que explicar.
+    activos = Producto.query.filter(Producto.activo == True)
+    nombre = db.session.query(Producto.nombre).filter(Producto.activo == True) \
+        .order_by(Producto.id.desc()).limit(1).scalar()
+    palabras = [p for p in (nombre or '').split() if tokenizar(p)]
+    busquedas = []
+    if palabras:
+        busqueda, (relevancia, sentido) = search_index.filtrar(activos, palabras[0])
+        relevancia = relevancia.asc() if sentido == 'asc' else relevancia.desc()
+        busquedas.append(('catalogo con busqueda',
+                          busqueda.order_by(relevancia, Producto.id.desc()).limit(13).statement))
+    return [
+        ('catalogo', db.select(Producto).where(
+            Producto.activo == True
+        ).order_by(Producto.id.desc()).limit(13)),
+        *busquedas,
+        ('catalogo por categoria', db.select(Producto).where(
+            Producto.activo == True, Producto.categoria_id == 1
+        ).order_by(Producto.id.desc()).limit(13)),
+        ('catalogo por precio', db.select(Producto).where(
+            Producto.activo == True
+        ).order_by(Producto.precio.asc(), Producto.id.asc()).limit(13)),
+        ('admin productos', db.select(Producto).order_by(Producto.id.desc()).limit(11)),
+        ('ventas (primera pagina)', db.select(Pedido).order_by(
+            Pedido.fecha_pedido.desc(), Pedido.id.desc()
+        ).limit(16)),
+        ('ventas (pagina siguiente)', db.select(Pedido).where(db.or_(
+            Pedido.fecha_pedido < datetime(2024, 1, 1),
+            db.and_(Pedido.fecha_pedido == datetime(2024, 1, 1), Pedido.id < 1000),
+        )).order_by(Pedido.fecha_pedido.desc(), Pedido.id.desc()).limit(16)),
+        ('pedidos por email', db.select(Pedido).where(Pedido.email_cliente == 'cliente@example.com')),
+        ('detalles de un pedido', db.select(DetallePedido).where(DetallePedido.pedido_id == 1)),
+        ('detalles de un producto', db.select(DetallePedido).where(DetallePedido.producto_id == 1)),
+        ('resenas de un producto', db.select(Resena).where(
+            Resena.producto_id == 1
+        ).order_by(Resena.fecha.desc())),
+    ]
+
+
+def _recorridos_postgres(plan):
+    """Tablas vigiladas que aparecen con 'Seq Scan' en un plan JSON de Postgres."""
+    tablas = []
+    if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in TABLAS_VIGILADAS:
+        tablas.append(plan['Relation Name'])
+    for hijo in plan.get('Plans', []):
+        tablas.extend(_recorridos_postgres(hijo))
+    return tablas
+
+
+def _recorre_clave_primaria(stmt, filas):
+    """
+    SQLite informa igual ('SCAN <tabla>') un recorrido completo que uno en el
+    orden de la clave primaria (rowid) que corta en el LIMIT, como el listado
+    del admin. Es lo segundo si hay LIMIT, se ordena por la clave primaria y
+    no hace falta ordenar aparte (sin 'TEMP B-TREE').
+    """
+    orden = getattr(stmt, '_order_by_clauses', ())
+    if getattr(stmt, '_limit_clause', None) is None or not orden:
+        return False
+    if any('TEMP B-TREE' in f[-1] for f in filas):
+        return False
+    columna = getattr(orden[0], 'element', orden[0])
+    return bool(getattr(columna, 'primary_key', False))
+
+
+def explicar(stmt, forzar_indices=False):
+    """
+    Devuelve (tablas_recorridas, plan_en_texto) de una consulta.
+    Con forzar_indices (solo Postgres) se desactiva el seq scan en la transacción:
+    en una base chica el planner prefiere recorrer la tabla aunque haya índice,
+    así se verifica que el índice existe y sirve para la consulta.
+    """
+    conexion = db.session.connection()
+    # render_postcompile: los IN (...) se expanden a un parámetro por valor
+    compilado = stmt.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True})
+
+    if db.engine.dialect.name == 'postgresql':
+        if forzar_indices:
+            conexion.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        plan = conexion.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + str(compilado), compilado.params).scalar()
+        texto = conexion.exec_driver_sql('EXPLAIN ' + str(compilado), compilado.params).fetchall()
+        return _recorridos_postgres(plan[0]['Plan']), '\n'.join(f[0] for f in texto)
+
+    # SQLite: 'SCAN <tabla>' sin índice es un recorrido completo
+    parametros = tuple(compilado.params[k] for k in compilado.positiontup) if compilado.positiontup else ()
+    filas = conexion.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compilado), parametros).fetchall()
+    if _recorre_clave_primaria(stmt, filas):
+        return [], '\n'.join(f[-1] for f in filas)
+    tablas = []
+    for fila in filas:
+        detalle = fila[-1]
+        if detalle.startswith('SCAN ') and 'INDEX' not in detalle:
+            tabla = detalle.split()[1]
+            if tabla in TABLAS_VIGILADAS:
+                tablas.append(tabla)
+    return tablas, '\n'.join(f[-1] for f in filas)
+
+
+def verificar_planes(forzar_indices=False):
+    """Lista de (nombre, tablas_recorridas, plan) para cada consulta clave."""
+    resultados = []
+    try:
+        for nombre, stmt in consultas_clave():
+            tablas, plan = explicar(stmt, forzar_indices)
+            resultados.append((nombre, tablas, plan))
+    finally:
+        db.session.rollback()
+    return resultados
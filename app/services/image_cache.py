@@ -0,0 +1,140 @@
+import json
+import os
+import tempfile
+from werkzeug.utils import secure_filename
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock, el recorte se hace sin lock entre procesos
+    fcntl = None
+
+
+class ImageCache:
+    """
+    Caché LRU en disco para las imágenes que se sirven desde la base de datos.
+
+    Cada imagen se guarda como un archivo en IMAGE_CACHE_DIR junto a un pequeño
+    '<nombre>.meta' (JSON) con su mimetype. Las escrituras son atómicas (archivo
+    temporal + os.replace), así varios workers de gunicorn comparten la carpeta
+    sin leer archivos a medio escribir. El orden LRU usa la fecha de
+    modificación, que se refresca en cada acierto.
+    """
+
+    def __init__(self, app=None):
+        self.directorio = None
+        self.max_bytes = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directorio = app.config.get('IMAGE_CACHE_DIR')
+        self.max_bytes = int(app.config.get('IMAGE_CACHE_MAX_MB', 0)) * 1024 * 1024
+        if self.habilitada:
+            os.makedirs(self.directorio, exist_ok=True)
+        app.extensions['image_cache'] = self
+
+    @property
+    def habilitada(self):
+        return bool(self.directorio) and self.max_bytes > 0
+
+    def _ruta(self, nombre):
+        """Ruta dentro de la caché, o None si el nombre no es seguro para disco."""
+        if not self.habilitada or not nombre or secure_filename(nombre) != nombre:
+            return None
+        return os.path.join(self.directorio, nombre)
+
+    def get(self, nombre):
+        """Devuelve (ruta, meta) si la imagen está en caché, o None."""
+        ruta = self._ruta(nombre)
+        if not ruta:
+            return None
+        try:
+            with open(ruta + '.meta', 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            # Marcar como usada recientemente (LRU por mtime)
+            os.utime(ruta, None)
+        except (OSError, ValueError):
+            return None
+        return ruta, meta
+
+    def put(self, nombre, datos, **meta):
+        """Guarda los bytes de una imagen. Devuelve (ruta, meta) o None si no se pudo."""
+        return self.put_stream(nombre, [datos], **meta)
+
+    def put_stream(self, nombre, partes, **meta):
+        """Como put(), pero escribe un iterable de partes sin juntarlas en memoria."""
+        ruta = self._ruta(nombre)
+        if not ruta:
+            return None
+        try:
+            self._escribir_atomico(ruta, partes)
+            self._escribir_atomico(ruta + '.meta', [json.dumps(meta).encode('utf-8')])
+        except OSError:
+            return None
+        self._recortar()
+        return ruta, meta
+
+    def invalidar(self, nombre):
+        """Elimina una imagen de la caché (visible para todos los workers)."""
+        ruta = self._ruta(nombre)
+        if not ruta:
+            return
+        for path in (ruta + '.meta', ruta):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _escribir_atomico(self, ruta, partes):
+        fd, tmp = tempfile.mkstemp(dir=self.directorio, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for parte in partes:
+                    f.write(parte)
+            os.replace(tmp, ruta)
+        except Exception:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def _recortar(self):
+        """Si la caché supera el límite, borra las imágenes menos usadas (hasta el 90%)."""
+        lock = None
+        try:
+            if fcntl:
+                lock = open(os.path.join(self.directorio, '.lock'), 'w')
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # Otro worker ya está recortando
+                    return
+
+            entradas = []
+            total = 0
+            with os.scandir(self.directorio) as it:
+                for entry in it:
+                    if entry.name.startswith('.') or entry.name.endswith('.meta'):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entradas.append((st.st_mtime, st.st_size, entry.name))
+                    total += st.st_size
+
+            if total <= self.max_bytes:
+                return
+
+            objetivo = int(self.max_bytes * 0.9)
+            for _, size, nombre in sorted(entradas):
+                if total <= objetivo:
+                    break
+                self.invalidar(nombre)
+                total -= size
+        except OSError:
+            pass
+        finally:
+            if lock:
+                lock.close()
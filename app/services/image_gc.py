@@ -0,0 +1,114 @@
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from app.extensions import db, image_cache, image_storage
+from app.models import Producto, Configuracion, ProductoImagen
+from app.services.image_service import nombre_base
+
+# Clave arbitraria para pg_try_advisory_lock: un solo worker corre el GC programado
+_LOCK_GC = 725431
+
+
+def bases_referenciadas():
+    """Bases de nombre de todas las imágenes usadas por productos y por las hero."""
+    bases = set()
+    for (fotos,) in db.session.query(Producto.fotos).yield_per(1000):
+        if isinstance(fotos, list):
+            bases.update(nombre_base(f) for f in fotos if f and not f.startswith('http'))
+
+    heroes = db.session.query(
+        Configuracion.hero_image_1, Configuracion.hero_image_2,
+        Configuracion.hero_image_3, Configuracion.hero_image_4
+    ).all()
+    for fila in heroes:
+        bases.update(nombre_base(h) for h in fila if h)
+    return bases
+
+
+def recolectar_huerfanas(ejecutar=False, lote=200, min_edad=timedelta(hours=24)):
+    """
+    Busca filas de ProductoImagen (originales y variantes) que nadie referencia y,
+    si ejecutar=True, las borra de a lotes (un commit por lote). Las imágenes más
+    nuevas que min_edad se respetan: pueden ser de una subida todavía en curso.
+    Devuelve {'imagenes': n, 'bytes': n, 'nombres': [primeros nombres]}.
+    """
+    referenciadas = bases_referenciadas()
+    limite = datetime.now() - min_edad
+    reporte = {'imagenes': 0, 'bytes': 0, 'nombres': []}
+    ultimo_id = 0
+
+    while True:
+        filas = db.session.query(
+            ProductoImagen.id, ProductoImagen.nombre, ProductoImagen.creado,
+            db.func.coalesce(ProductoImagen.tamano, db.func.length(ProductoImagen.datos)).label('tamano')
+        ).filter(ProductoImagen.id > ultimo_id).order_by(ProductoImagen.id).limit(lote).all()
+        if not filas:
+            break
+        ultimo_id = filas[-1].id
+
+        huerfanas = [
+            f for f in filas
+            if nombre_base(f.nombre) not in referenciadas and (f.creado is None or f.creado < limite)
+        ]
+        if not huerfanas:
+            continue
+
+        reporte['imagenes'] += len(huerfanas)
+        reporte['bytes'] += sum(f.tamano or 0 for f in huerfanas)
+        reporte['nombres'].extend(f.nombre for f in huerfanas[:max(0, 20 - len(reporte['nombres']))])
+
+        if ejecutar:
+            nombres = [f.nombre for f in huerfanas]
+            image_storage.eliminar(nombres)
+            db.session.commit()
+            for nombre in nombres:
+                image_cache.invalidar(nombre)
+
+    return reporte
+
+
+@contextmanager
+def lock_gc():
+    """
+    Cede True si este proceso puede correr el GC (siempre fuera de Postgres).
+    El advisory lock es de la conexión, no de la transacción: se toma y se
+    suelta en una conexión propia que se mantiene toda la corrida, porque
+    recolectar_huerfanas hace commit por lote y la sesión cambia de conexión.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        yield True
+        return
+    with db.engine.connect() as conn:
+        tomado = conn.execute(db.text("SELECT pg_try_advisory_lock(:k)"), {'k': _LOCK_GC}).scalar()
+        conn.commit()
+        try:
+            yield tomado
+        finally:
+            if tomado:
+                conn.execute(db.text("SELECT pg_advisory_unlock(:k)"), {'k': _LOCK_GC})
+                conn.commit()
+
+
+def iniciar_gc_programado(app):
+    """Si IMAGE_GC_INTERVALO_HORAS > 0, corre el GC periódicamente en un thread de fondo."""
+    horas = app.config.get('IMAGE_GC_INTERVALO_HORAS', 0)
+    if not horas:
+        return
+
+    def _loop():
+        while True:
+            time.sleep(horas * 3600)
+            with app.app_context():
+                try:
+                    with lock_gc() as tomado:
+                        if not tomado:
+                            continue
+                        reporte = recolectar_huerfanas(
+                            ejecutar=True, min_edad=timedelta(hours=app.config.get('IMAGE_GC_MIN_EDAD_HORAS', 24)))
+                        print(f"GC de imágenes: {reporte['imagenes']} eliminadas ({reporte['bytes'] / 1024 / 1024:.1f} MB)")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error en GC de imágenes: {e}")
+
+    threading.Thread(target=_loop, name='imagenes-gc', daemon=True).start()
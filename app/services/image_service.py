@@ -0,0 +1,195 @@
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+from flask import url_for, current_app
+from PIL import Image
+
+# Tamaños pre-generados al subir (el original queda como 'full', hasta 1200x1200)
+VARIANTES = {
+    'thumb': (160, 160),   # tablas del admin, miniaturas de la galería
+    'card': (600, 600),    # tarjetas del catálogo y relacionados
+}
+ANCHO_FULL = 1200
+
+
+def nombre_variante(nombre, tamano=None, formato=None):
+    """
+    Nombre con el que se guarda una variante de una imagen subida.
+    'abc.jpg' -> 'abc__thumb.jpg' (tamano='thumb'), 'abc.webp' (formato='webp').
+    """
+    if '.' not in nombre:
+        return nombre
+    base, ext = nombre.rsplit('.', 1)
+    if tamano and tamano != 'full':
+        base = f"{base}__{tamano}"
+    return f"{base}.{formato or ext}"
+
+
+def nombre_base(nombre):
+    """Parte común a una imagen y todas sus variantes: 'abc__thumb.webp' -> 'abc'."""
+    return nombre.rsplit('.', 1)[0].split('__', 1)[0]
+
+
+def nombres_relacionados(nombre):
+    """El original y todas sus variantes posibles (para borrar o invalidar caché)."""
+    nombres = [nombre]
+    for tamano in ['full'] + list(VARIANTES):
+        for formato in (None, 'webp'):
+            candidato = nombre_variante(nombre, tamano, formato)
+            if candidato not in nombres:
+                nombres.append(candidato)
+    return nombres
+
+
+def _codificar(img, formato, quality):
+    buffer = io.BytesIO()
+    img.save(buffer, format=formato, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def procesar_original(datos, ext, nombre_base, max_size=(ANCHO_FULL, ANCHO_FULL), quality=75):
+    """
+    Redimensiona y comprime una imagen subida. Devuelve (nombre, datos, mimetype)
+    de la versión 'full', que es la que se guarda en Producto.fotos.
+    """
+    # Los GIF se guardan tal cual (pueden ser animados)
+    if ext == 'gif':
+        return f"{nombre_base}.gif", datos, 'image/gif'
+
+    img = Image.open(io.BytesIO(datos))
+    if img.format == 'JPEG':
+        # Decodifica directo a una escala reducida (1/2, 1/4, 1/8): fotos de 12MP
+        # de un celular usan una fracción de la memoria y del tiempo
+        img.draft('RGB', max_size)
+
+    # Convertir a RGB si es necesario
+    if img.mode in ("RGBA", "P"):
+        target_format, mimetype, ext_final = "WEBP", "image/webp", "webp"
+    else:
+        img = img.convert("RGB")
+        target_format, mimetype, ext_final = "JPEG", "image/jpeg", "jpg"
+
+    # Resize manteniendo aspect ratio
+    img.thumbnail(max_size, Image.Resampling.LANCZOS)
+    return f"{nombre_base}.{ext_final}", _codificar(img, target_format, quality), mimetype
+
+
+def generar_variantes(nombre, datos, mimetype, quality=75):
+    """Variantes (tamaños y WebP) a partir de la versión 'full'. Lista de (nombre, datos, mimetype)."""
+    if mimetype == 'image/gif':
+        return []
+
+    img = Image.open(io.BytesIO(datos))
+    target_format = "JPEG" if mimetype == 'image/jpeg' else "WEBP"
+    renditions = []
+
+    # JPEG: además una versión WebP del original (~30% menos bytes)
+    if target_format == "JPEG":
+        renditions.append((nombre_variante(nombre, formato='webp'), _codificar(img, "WEBP", quality), 'image/webp'))
+
+    for tamano, dimensiones in VARIANTES.items():
+        variante = img.copy()
+        variante.thumbnail(dimensiones, Image.Resampling.LANCZOS)
+        renditions.append((nombre_variante(nombre, tamano), _codificar(variante, target_format, quality), mimetype))
+        if target_format == "JPEG":
+            renditions.append((nombre_variante(nombre, tamano, 'webp'), _codificar(variante, "WEBP", quality), 'image/webp'))
+
+    return renditions
+
+
+# --- Pool de procesamiento ---
+# Pillow libera el GIL al decodificar, redimensionar y codificar, así que un pool
+# de threads procesa varias fotos en paralelo sin el costo de pickle de procesos.
+# Las variantes van en su propio pool: si compartieran el de las subidas, la
+# próxima subida esperaría detrás de las variantes de la anterior.
+_POOLS = {'subidas': ('IMAGE_WORKERS', 4), 'variantes': ('IMAGE_VARIANT_WORKERS', 2)}
+_pools = {}  # nombre -> (pool, pid)
+_pool_lock = threading.Lock()
+
+
+def _obtener_pool(nombre='subidas'):
+    """Pool por proceso (se crea después del fork de cada worker de gunicorn)."""
+    with _pool_lock:
+        pool, pid = _pools.get(nombre, (None, None))
+        if pool is None or pid != os.getpid():
+            opcion, por_defecto = _POOLS[nombre]
+            pool = ThreadPoolExecutor(max_workers=current_app.config.get(opcion, por_defecto),
+                                      thread_name_prefix=f'imagenes-{nombre}')
+            _pools[nombre] = (pool, os.getpid())
+        return pool
+
+
+def procesar_subidas(archivos, prefix="", max_size=(ANCHO_FULL, ANCHO_FULL), quality=75):
+    """
+    Procesa en paralelo las versiones 'full' de varias subidas.
+    'archivos' es una lista de (filename, datos); devuelve lista de (nombre, datos, mimetype).
+    """
+    if not archivos:
+        return []
+    pool = _obtener_pool()
+    futuros = [
+        pool.submit(procesar_original, datos, filename.rsplit('.', 1)[1].lower(),
+                    f"{prefix}{uuid4().hex}", max_size, quality)
+        for filename, datos in archivos
+    ]
+    return [f.result() for f in futuros]
+
+
+def programar_variantes(originales, quality=75):
+    """
+    Genera y guarda las variantes en segundo plano; mientras tanto se sirve el
+    original. Se encolan recién después del commit de la sesión actual: si el
+    request termina en rollback, no quedan variantes de imágenes que no se guardaron.
+    """
+    from app.services.checkout_service import al_confirmar
+
+    if not originales:
+        return
+    app = current_app._get_current_object()
+    al_confirmar(_encolar_variantes, _obtener_pool('variantes'), app, list(originales), quality)
+
+
+def _encolar_variantes(pool, app, originales, quality):
+    for nombre, datos, mimetype in originales:
+        pool.submit(_guardar_variantes, app, nombre, datos, mimetype, quality)
+
+
+def _guardar_variantes(app, nombre, datos, mimetype, quality):
+    from app.extensions import db, image_cache, image_storage
+
+    with app.app_context():
+        try:
+            variantes = generar_variantes(nombre, datos, mimetype, quality)
+            for nombre_var, datos_var, mimetype_var in variantes:
+                image_storage.guardar(nombre_var, datos_var, mimetype_var,
+                                      etag=hashlib.sha256(datos_var).hexdigest())
+            db.session.commit()
+            # Si alguien pidió la variante antes de que existiera, la caché tiene el original
+            for nombre_var, _, _ in variantes:
+                image_cache.invalidar(nombre_var)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error generando variantes de {nombre}: {e}")
+
+
+def imagen_url(foto, tamano=None):
+    """URL pública de una foto de producto (las externas 'http...' se usan tal cual)."""
+    if not foto:
+        return ''
+    if foto.startswith('http'):
+        return foto
+    if tamano and tamano in VARIANTES:
+        return url_for('api.imagen_producto', filename=foto, size=tamano)
+    return url_for('api.imagen_producto', filename=foto)
+
+
+def imagen_srcset(foto):
+    """Atributo srcset con todas las variantes de una foto subida."""
+    if not foto or foto.startswith('http'):
+        return ''
+    partes = [f"{imagen_url(foto, tamano)} {dim[0]}w" for tamano, dim in VARIANTES.items()]
+    partes.append(f"{imagen_url(foto)} {ANCHO_FULL}w")
+    return ', '.join(partes)
@@ -0,0 +1,238 @@
+import os
+import tempfile
+from werkzeug.utils import secure_filename
+
+try:
+    import boto3
+except ImportError:  # Solo hace falta con IMAGE_STORAGE=s3
+    boto3 = None
+
+
+class DatabaseBackend:
+    """Los bytes viven en producto_imagenes.datos (comportamiento original)."""
+    nombre = 'db'
+
+    def guardar(self, fila, datos, mimetype):
+        fila.datos = datos
+
+    def partes(self, fila, tamano_parte):
+        from app.models import ProductoImagen
+        return ProductoImagen.leer_por_partes(fila.id, fila.tamano or 0, tamano_parte)
+
+    def eliminar(self, nombre):
+        # Los bytes se van con la fila
+        pass
+
+    def ruta_local(self, fila):
+        return None
+
+
+class FilesystemBackend:
+    """Un archivo por imagen en IMAGE_STORAGE_DIR (disco local o un volumen montado)."""
+    nombre = 'filesystem'
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, nombre):
+        if secure_filename(nombre) != nombre:
+            raise ValueError(f"Nombre de imagen inválido: {nombre!r}")
+        return os.path.join(self.directorio, nombre)
+
+    def guardar(self, fila, datos, mimetype):
+        ruta = self._ruta(fila.nombre)
+        fd, tmp = tempfile.mkstemp(dir=self.directorio, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(datos)
+            os.replace(tmp, ruta)
+        except Exception:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def partes(self, fila, tamano_parte):
+        with open(self._ruta(fila.nombre), 'rb') as f:
+            while True:
+                parte = f.read(tamano_parte)
+                if not parte:
+                    break
+                yield parte
+
+    def eliminar(self, nombre):
+        try:
+            os.remove(self._ruta(nombre))
+        except (OSError, ValueError):
+            pass
+
+    def ruta_local(self, fila):
+        ruta = self._ruta(fila.nombre)
+        return ruta if os.path.exists(ruta) else None
+
+
+class S3Backend:
+    """
+    Bucket S3 o compatible (MinIO, R2, etc.). Con S3_ENDPOINT_URL se puede apuntar
+    a un servidor local (MinIO o 'moto_server') para probarlo sin AWS.
+    """
+    nombre = 's3'
+
+    def __init__(self, bucket, prefijo='', endpoint_url=None, region=None, access_key=None, secret_key=None):
+        if boto3 is None:
+            raise RuntimeError("IMAGE_STORAGE='s3' requiere el paquete boto3 (pip install boto3).")
+        if not bucket:
+            raise RuntimeError("IMAGE_STORAGE='s3' requiere S3_BUCKET.")
+        self.bucket = bucket
+        self.prefijo = prefijo
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+        )
+
+    def _key(self, nombre):
+        return f"{self.prefijo}{nombre}"
+
+    def guardar(self, fila, datos, mimetype):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(fila.nombre), Body=datos, ContentType=mimetype)
+
+    def partes(self, fila, tamano_parte):
+        body = self.client.get_object(Bucket=self.bucket, Key=self._key(fila.nombre))['Body']
+        try:
+            yield from body.iter_chunks(tamano_parte)
+        finally:
+            body.close()
+
+    def eliminar(self, nombre):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(nombre))
+
+    def ruta_local(self, fila):
+        return None
+
+
+class ImageStorage:
+    """
+    Punto único de acceso a los bytes de las imágenes subidas.
+
+    La fila ProductoImagen guarda siempre los metadatos (nombre, mimetype, etag...)
+    y en 'almacenamiento' qué backend tiene los bytes; las imágenes nuevas van al
+    backend de IMAGE_STORAGE y las existentes se siguen leyendo del suyo hasta
+    migrarlas con 'flask imagenes-migrar'.
+    """
+
+    def __init__(self, app=None):
+        self.config = {}
+        self._backends = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.config = app.config
+        self._backends = {}
+        app.extensions['image_storage'] = self
+
+    @property
+    def actual(self):
+        """Backend donde se guardan las imágenes nuevas."""
+        return self.backend(self.config.get('IMAGE_STORAGE', 'db'))
+
+    def backend(self, nombre):
+        if nombre not in self._backends:
+            if nombre == 'db':
+                self._backends[nombre] = DatabaseBackend()
+            elif nombre == 'filesystem':
+                self._backends[nombre] = FilesystemBackend(self.config['IMAGE_STORAGE_DIR'])
+            elif nombre == 's3':
+                self._backends[nombre] = S3Backend(
+                    bucket=self.config.get('S3_BUCKET'),
+                    prefijo=self.config.get('S3_PREFIX', ''),
+                    endpoint_url=self.config.get('S3_ENDPOINT_URL'),
+                    region=self.config.get('S3_REGION'),
+                    access_key=self.config.get('S3_ACCESS_KEY'),
+                    secret_key=self.config.get('S3_SECRET_KEY'),
+                )
+            else:
+                raise ValueError(f"Backend de imágenes desconocido: {nombre!r}")
+        return self._backends[nombre]
+
+    def guardar(self, nombre, datos, mimetype, **extra):
+        """
+        Crea la fila ProductoImagen (en la sesión actual) y guarda los bytes. En
+        disco o S3 se escriben ya (la imagen tiene que existir cuando se vea la
+        fila) y se borran si la transacción termina sin commit.
+        """
+        from app.extensions import db
+        from app.models import ProductoImagen
+        from app.services.checkout_service import al_revertir
+
+        backend = self.actual
+        fila = ProductoImagen(nombre=nombre, mimetype=mimetype, tamano=len(datos),
+                              almacenamiento=backend.nombre, **extra)
+        backend.guardar(fila, datos, mimetype)
+        al_revertir(backend.eliminar, nombre)
+        db.session.add(fila)
+        return fila
+
+    def partes(self, fila, tamano_parte):
+        return self.backend(fila.almacenamiento or 'db').partes(fila, tamano_parte)
+
+    def ruta_local(self, fila):
+        return self.backend(fila.almacenamiento or 'db').ruta_local(fila)
+
+    def eliminar(self, nombres):
+        """
+        Borra las filas con esos nombres en la sesión actual. Los bytes del
+        backend se borran recién después del commit: si la transacción se
+        revierte, las filas siguen apuntando a su contenido.
+        """
+        from app.extensions import db
+        from app.models import ProductoImagen
+        from app.services.checkout_service import al_confirmar
+
+        filas = db.session.query(ProductoImagen.nombre, ProductoImagen.almacenamiento) \
+            .filter(ProductoImagen.nombre.in_(nombres)).all()
+        ProductoImagen.query.filter(ProductoImagen.nombre.in_(nombres)).delete(synchronize_session=False)
+        for nombre, almacenamiento in filas:
+            al_confirmar(self.backend(almacenamiento or 'db').eliminar, nombre)
+        return len(filas)
+
+    def migrar(self, destino=None, lote=50, tamano_parte=256 * 1024):
+        """
+        Mueve las imágenes que no están en 'destino' a ese backend, de a lotes
+        (un commit por lote). Devuelve (imagenes, bytes) migrados.
+        """
+        from app.extensions import db
+        from app.models import ProductoImagen
+        from app.services.checkout_service import al_confirmar, al_revertir
+
+        destino = self.backend(destino or self.config.get('IMAGE_STORAGE', 'db'))
+        total_imagenes = total_bytes = 0
+        ultimo_id = 0
+        while True:
+            filas = ProductoImagen.query.filter(
+                ProductoImagen.id > ultimo_id,
+                db.func.coalesce(ProductoImagen.almacenamiento, 'db') != destino.nombre
+            ).order_by(ProductoImagen.id).limit(lote).all()
+            if not filas:
+                break
+            for fila in filas:
+                if fila.tamano is None:
+                    fila.tamano = db.session.query(db.func.length(ProductoImagen.datos)).filter_by(id=fila.id).scalar() or 0
+                datos = b''.join(self.partes(fila, tamano_parte))
+                # Recién con el lote confirmado se borran los bytes del origen; si falla, los copiados
+                al_confirmar(self.backend(fila.almacenamiento or 'db').eliminar, fila.nombre)
+                destino.guardar(fila, datos, fila.mimetype)
+                al_revertir(destino.eliminar, fila.nombre)
+                fila.almacenamiento = destino.nombre
+                if destino.nombre != 'db':
+                    fila.datos = None
+                total_imagenes += 1
+                total_bytes += len(datos)
+                ultimo_id = fila.id
+            db.session.commit()
+        return total_imagenes, total_bytes
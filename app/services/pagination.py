@@ -0,0 +1,180 @@
+import hashlib
+import math
+from datetime import datetime
+from decimal import Decimal
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import and_, or_
+from app.extensions import db, query_cache
+
+# Por debajo de esta estimación de Postgres se cuenta exacto (es barato y la estimación es mala)
+UMBRAL_CONTEO_EXACTO = 10000
+
+
+class PaginaKeyset:
+    """
+    Una página de resultados paginados por cursor (keyset).
+
+    Expone lo que usan los templates: items, has_prev/has_next, prev_cursor/
+    next_cursor (tokens opacos para ?cursor=), page, pages y total. El total
+    puede ser una estimación (total_estimado=True) y se calcula solo en la
+    primera página: viaja dentro del cursor a las siguientes.
+    """
+
+    def __init__(self, items, per_page, page, total, total_estimado, prev_cursor, next_cursor, has_prev, has_next):
+        self.items = items
+        self.per_page = per_page
+        self.page = page
+        self.total = total
+        self.total_estimado = total_estimado
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+        self.has_prev = has_prev
+        self.has_next = has_next
+
+    @property
+    def pages(self):
+        if self.total is None:
+            return self.page + (1 if self.has_next else 0)
+        return max(1, math.ceil(self.total / self.per_page), self.page + (1 if self.has_next else 0))
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.secret_key, salt='paginacion')
+
+
+def _a_json(valor):
+    if isinstance(valor, datetime):
+        return {'dt': valor.isoformat()}
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return valor
+
+
+def _de_json(valor):
+    if isinstance(valor, dict) and 'dt' in valor:
+        return datetime.fromisoformat(valor['dt'])
+    return valor
+
+
+def _firma(query, orden):
+    """Identifica filtros + orden: un cursor de otra búsqueda u otro orden se ignora."""
+    compilado = query.order_by(None).statement.compile(dialect=db.engine.dialect)
+    texto = str(compilado) + repr(sorted(compilado.params.items())) + repr([(str(e), s) for e, s in orden])
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()[:12]
+
+
+def _cursor(firma, direccion, claves, page, total, estimado):
+    return _serializer().dumps({
+        'f': firma, 'd': direccion, 'k': [_a_json(v) for v in claves],
+        'p': page, 't': total, 'e': estimado,
+    })
+
+
+def _leer_cursor(cursor, firma):
+    if not cursor:
+        return None
+    try:
+        datos = _serializer().loads(cursor)
+    except BadSignature:
+        return None
+    if not isinstance(datos, dict) or datos.get('f') != firma:
+        return None
+    datos['k'] = [_de_json(v) for v in datos.get('k', [])]
+    return datos
+
+
+def _condicion(orden, valores, hacia_atras):
+    """Filas posteriores a 'valores' según 'orden' (o anteriores si hacia_atras)."""
+    condiciones = []
+    for i, ((expr, sentido), valor) in enumerate(zip(orden, valores)):
+        ascendente = (sentido == 'asc') != hacia_atras
+        comparacion = expr > valor if ascendente else expr < valor
+        iguales = [orden[j][0] == valores[j] for j in range(i)]
+        condiciones.append(and_(*iguales, comparacion))
+    return or_(*condiciones)
+
+
+def _ordenar(query, orden, hacia_atras):
+    clausulas = []
+    for expr, sentido in orden:
+        ascendente = (sentido == 'asc') != hacia_atras
+        clausulas.append(expr.asc() if ascendente else expr.desc())
+    return query.order_by(None).order_by(*clausulas)
+
+
+def contar(query, modo='estimado', tags=()):
+    """
+    Total de filas de la query. Devuelve (total, es_estimado).
+    'exacto' hace COUNT(*); 'estimado' usa la estimación del planner en Postgres
+    (EXPLAIN, sin recorrer la tabla) y en otras bases un COUNT(*) cacheado con tags.
+    """
+    query = query.order_by(None)
+    if modo == 'exacto':
+        return query.count(), False
+
+    if db.engine.dialect.name == 'postgresql':
+        compilado = query.statement.compile(dialect=db.engine.dialect)
+        plan = db.session.connection().exec_driver_sql(
+            'EXPLAIN (FORMAT JSON) ' + str(compilado), compilado.params
+        ).scalar()
+        estimacion = int(plan[0]['Plan']['Plan Rows'])
+        if estimacion >= UMBRAL_CONTEO_EXACTO:
+            return estimacion, True
+        return query.count(), False
+
+    compilado = query.statement.compile(dialect=db.engine.dialect)
+    clave = 'conteo:' + hashlib.sha1((str(compilado) + repr(sorted(compilado.params.items()))).encode('utf-8')).hexdigest()
+    return query_cache.obtener(clave, query.count, tags=tags), False
+
+
+def paginar(query, orden, cursor=None, per_page=20, conteo='estimado', tags=()):
+    """
+    Pagina 'query' por cursor en vez de OFFSET: cada página pide las filas que
+    siguen a la última clave vista, así las páginas profundas cuestan lo mismo
+    que la primera.
+
+    'orden' es una lista de (expresión, 'asc'|'desc') que tiene que terminar en
+    una columna única (normalmente el id). Las claves de punto flotante tienen
+    que ser double precision: el cursor las guarda como float de Python y un
+    float4 no compara igual al volver (ver search_service). 'conteo' es
+    'estimado', 'exacto' o None (sin total). 'tags' son los modelos de la
+    query (para cachear el conteo).
+    """
+    firma = _firma(query, orden)
+    datos = _leer_cursor(cursor, firma)
+    hacia_atras = bool(datos) and datos['d'] == 'p'
+
+    q = query.add_columns(*[expr.label(f'_k{i}') for i, (expr, _) in enumerate(orden)])
+    if datos:
+        q = q.filter(_condicion(orden, datos['k'], hacia_atras))
+    filas = _ordenar(q, orden, hacia_atras).limit(per_page + 1).all()
+
+    hay_mas = len(filas) > per_page
+    filas = filas[:per_page]
+    if hacia_atras:
+        filas.reverse()
+
+    if datos:
+        page = max(1, datos['p'])
+        total, estimado = datos['t'], datos['e']
+    else:
+        page = 1
+        total, estimado = contar(query, conteo, tags) if conteo else (None, False)
+
+    if hacia_atras:
+        has_prev, has_next = hay_mas, True
+        if not hay_mas:
+            page = 1
+    else:
+        has_prev, has_next = datos is not None, hay_mas
+
+    items = [fila[0] for fila in filas]
+    claves = [list(fila[1:]) for fila in filas]
+    prev_cursor = next_cursor = None
+    if has_prev and claves and page > 2:
+        prev_cursor = _cursor(firma, 'p', claves[0], page - 1, total, estimado)
+    if has_next and claves:
+        next_cursor = _cursor(firma, 'n', claves[-1], page + 1, total, estimado)
+
+    return PaginaKeyset(items, per_page, page, total, estimado, prev_cursor, next_cursor, has_prev, has_next)
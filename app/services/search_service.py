@@ -0,0 +1,279 @@
+import bisect
+import re
+import threading
+import time
+import unicodedata
+from sqlalchemy import event
+
+# Sufijos que se recortan para llevar una palabra a su raíz (orden: más largos primero).
+# Es un stemmer liviano para desarrollo; en Postgres se usa el 'spanish_stem' real.
+_SUFIJOS = (
+    'amientos', 'imientos', 'amiento', 'imiento', 'aciones', 'uciones', 'adoras', 'adores',
+    'ancias', 'mente', 'acion', 'ucion', 'adora', 'ador', 'ancia', 'idad', 'ismo', 'ista',
+    'able', 'ible', 'osos', 'osas', 'oso', 'osa', 'es', 'os', 'as', 's', 'a', 'o', 'e',
+)
+_STOPWORDS = {'de', 'la', 'el', 'los', 'las', 'y', 'en', 'con', 'para', 'por', 'un', 'una', 'del', 'al'}
+_PALABRA = re.compile(r'\w+')
+
+# Peso de cada campo en el ranking (como setweight 'A' y 'B' en Postgres)
+_PESO_NOMBRE = 2.0
+_PESO_DESCRIPCION = 1.0
+
+
+def normalizar(texto):
+    """Minúsculas y sin acentos: 'Anteójos' -> 'anteojos'."""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def raiz(palabra):
+    for sufijo in _SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= 3:
+            return palabra[:-len(sufijo)]
+    return palabra
+
+
+def tokenizar(texto):
+    """Raíces de las palabras significativas del texto."""
+    return [raiz(p) for p in _PALABRA.findall(normalizar(texto)) if p not in _STOPWORDS]
+
+
+class IndiceBusqueda:
+    """
+    Búsqueda de productos con ranking para el parámetro ?q= del catálogo.
+
+    En Postgres usa la columna generada 'productos.busqueda_tsv' (tsvector con
+    stemming en español y unaccent, índice GIN; la crea la migración 6). En
+    SQLite, o si la columna no existe, usa un índice invertido en memoria por
+    proceso que se reconstruye cuando cambia un producto (eventos del ORM) o
+    vence SEARCH_INDEX_TTL. Si la columna falta se vuelve a buscar cada
+    SEARCH_INDEX_TTL (la pudo crear un 'db-upgrade' de otro proceso).
+    """
+
+    def __init__(self, app=None):
+        self.modo = 'auto'
+        self.ttl = 300
+        self._tsv_disponible = None
+        self._tsv_verificado = 0
+        self._lock = threading.Lock()
+        self._indice = {}
+        self._terminos = []
+        self._construido = 0
+        self._sucio = True
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app.models import Producto
+
+        self.modo = app.config.get('SEARCH_BACKEND', 'auto')
+        self.ttl = app.config.get('SEARCH_INDEX_TTL', 300)
+        for evento in ('after_insert', 'after_update', 'after_delete'):
+            if not event.contains(Producto, evento, self._marcar_sucio):
+                event.listen(Producto, evento, self._marcar_sucio)
+        app.extensions['search_index'] = self
+
+    def _marcar_sucio(self, mapper, connection, target):
+        self._sucio = True
+
+    def reiniciar(self):
+        """Olvida si existe la columna tsvector (después de migrar el esquema)."""
+        self._tsv_disponible = None
+
+    # --- Postgres ---
+
+    def usa_postgres(self):
+        from app.extensions import db
+
+        if self.modo == 'python':
+            return False
+        vencido = not self._tsv_disponible and time.monotonic() - self._tsv_verificado >= self.ttl
+        if self._tsv_disponible is None or vencido:
+            self._tsv_disponible = db.engine.dialect.name == 'postgresql' and bool(db.session.execute(db.text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'productos' AND column_name = 'busqueda_tsv'"
+            )).scalar())
+            self._tsv_verificado = time.monotonic()
+        return self._tsv_disponible
+
+    def _filtrar_postgres(self, query, texto):
+        from app.extensions import db
+
+        tsv = db.literal_column('productos.busqueda_tsv')
+        consulta = db.func.websearch_to_tsquery('es_unaccent', texto)
+        # ts_rank_cd devuelve float4: se pasa a double para que el valor que guarda el
+        # cursor (un float de Python) compare igual en la página siguiente y no se salteen empates
+        relevancia = db.cast(db.func.ts_rank_cd(tsv, consulta), db.Float(53))
+        return query.filter(tsv.op('@@')(consulta)), (relevancia, 'desc')
+
+    # --- Índice en memoria ---
+
+    def _construir(self):
+        from app.extensions import db
+        from app.models import Producto
+
+        indice = {}
+        filas = db.session.query(Producto.id, Producto.nombre, Producto.descripcion).yield_per(500)
+        for producto_id, nombre, descripcion in filas:
+            for peso, texto in ((_PESO_NOMBRE, nombre), (_PESO_DESCRIPCION, descripcion)):
+                for termino in tokenizar(texto):
+                    pesos = indice.setdefault(termino, {})
+                    pesos[producto_id] = pesos.get(producto_id, 0) + peso
+        self._indice = indice
+        self._terminos = sorted(indice)
+        self._construido = time.monotonic()
+        self._sucio = False
+
+    def _vigente(self):
+        return not self._sucio and time.monotonic() - self._construido < self.ttl
+
+    def buscar_ids(self, texto):
+        """IDs de productos que contienen todos los términos, ordenados por relevancia."""
+        terminos = tokenizar(texto)
+        if not terminos:
+            return []
+        if not self._vigente():
+            with self._lock:
+                if not self._vigente():
+                    self._construir()
+
+        puntajes = None
+        for i, termino in enumerate(terminos):
+            coincidencias = dict(self._indice.get(termino, {}))
+            # El último término también vale como prefijo (búsqueda mientras se escribe)
+            if i == len(terminos) - 1:
+                pos = bisect.bisect_left(self._terminos, termino)
+                while pos < len(self._terminos) and self._terminos[pos].startswith(termino):
+                    for producto_id, peso in self._indice[self._terminos[pos]].items():
+                        coincidencias[producto_id] = max(coincidencias.get(producto_id, 0), peso)
+                    pos += 1
+            if puntajes is None:
+                puntajes = coincidencias
+            else:
+                puntajes = {pid: p + coincidencias[pid] for pid, p in puntajes.items() if pid in coincidencias}
+            if not puntajes:
+                return []
+        return sorted(puntajes, key=lambda pid: (-puntajes[pid], -pid))
+
+    # --- API ---
+
+    def filtrar(self, query, texto):
+        """
+        Aplica la búsqueda a una query de Producto.
+        Devuelve (query, relevancia) donde 'relevancia' es (expresión, 'asc'|'desc').
+        """
+        from app.extensions import db
+        from app.models import Producto
+
+        if self.usa_postgres():
+            return self._filtrar_postgres(query, texto)
+
+        ids = self.buscar_ids(texto)
+        if not ids:
+            return query.filter(db.false()), (Producto.id, 'desc')
+        posiciones = {pid: pos for pos, pid in enumerate(ids)}
+        return query.filter(Producto.id.in_(ids)), (db.case(posiciones, value=Producto.id), 'asc')
+
+
+class IndiceSugerencias:
+    """
+    Índice de prefijos para el autocompletado del buscador (/api/buscar/sugerencias).
+
+    Es un array ordenado de claves normalizadas (el nombre completo y cada final
+    desde el inicio de una palabra, así 'sol' encuentra 'Anteojos de sol') sobre
+    productos activos y categorías activas. Se consulta con bisect sin tocar la
+    base; admin.py lo actualiza al crear, editar o activar/desactivar, y cada
+    SEARCH_INDEX_TTL se reconstruye entero para tomar cambios de otros workers.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 300
+        self._lock = threading.Lock()
+        self._claves = []      # [(clave, tipo, id)] ordenado
+        self._entradas = {}    # (tipo, id) -> (nombre, [claves])
+        self._construido = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('SEARCH_INDEX_TTL', 300)
+        app.extensions['suggest_index'] = self
+
+    @staticmethod
+    def _claves_de(nombre):
+        palabras = _PALABRA.findall(normalizar(nombre))
+        return sorted({' '.join(palabras[i:]) for i in range(len(palabras))})
+
+    def _agregar(self, tipo, id, nombre):
+        claves = self._claves_de(nombre)
+        self._entradas[(tipo, id)] = (nombre, claves)
+        for clave in claves:
+            bisect.insort(self._claves, (clave, tipo, id))
+
+    def _quitar(self, tipo, id):
+        entrada = self._entradas.pop((tipo, id), None)
+        if not entrada:
+            return
+        for clave in entrada[1]:
+            pos = bisect.bisect_left(self._claves, (clave, tipo, id))
+            if pos < len(self._claves) and self._claves[pos] == (clave, tipo, id):
+                del self._claves[pos]
+
+    def _construir(self):
+        from app.extensions import db
+        from app.models import Producto, Categoria
+
+        self._claves, self._entradas = [], {}
+        for id, nombre in db.session.query(Categoria.id, Categoria.nombre).filter(Categoria.activa == True):
+            self._agregar('categoria', id, nombre)
+        for id, nombre in db.session.query(Producto.id, Producto.nombre).filter(Producto.activo == True).yield_per(500):
+            self._agregar('producto', id, nombre)
+        self._construido = time.monotonic()
+
+    def _asegurar(self):
+        if self._construido is None or time.monotonic() - self._construido >= self.ttl:
+            self._construir()
+
+    # --- Actualizaciones incrementales (llamadas desde admin.py después del commit) ---
+
+    def actualizar_producto(self, producto):
+        self._actualizar('producto', producto.id, producto.nombre, producto.activo)
+
+    def quitar_producto(self, id):
+        self._actualizar('producto', id, None, False)
+
+    def actualizar_categoria(self, categoria):
+        self._actualizar('categoria', categoria.id, categoria.nombre, categoria.activa)
+
+    def quitar_categoria(self, id):
+        self._actualizar('categoria', id, None, False)
+
+    def _actualizar(self, tipo, id, nombre, activo):
+        with self._lock:
+            if self._construido is None:
+                return  # Todavía no se construyó: se arma completo en la primera consulta
+            self._quitar(tipo, id)
+            if activo and nombre:
+                self._agregar(tipo, id, nombre)
+
+    # --- Consulta ---
+
+    def buscar(self, texto, limite=8):
+        """Lista de (tipo, id, nombre): primero categorías, después productos, sin repetir."""
+        prefijo = ' '.join(_PALABRA.findall(normalizar(texto)))
+        if not prefijo:
+            return []
+        with self._lock:
+            self._asegurar()
+            vistos = set()
+            resultado = {'categoria': [], 'producto': []}
+            pos = bisect.bisect_left(self._claves, (prefijo,))
+            while pos < len(self._claves) and len(vistos) < limite * 2:
+                clave, tipo, id = self._claves[pos]
+                if not clave.startswith(prefijo):
+                    break
+                if (tipo, id) not in vistos:
+                    vistos.add((tipo, id))
+                    resultado[tipo].append((tipo, id, self._entradas[(tipo, id)][0]))
+                pos += 1
+        return (resultado['categoria'] + resultado['producto'])[:limite]
@@ -0,0 +1,339 @@
+import csv
+import hashlib
+import io
+import json
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from uuid import uuid4
+from PIL import Image
+from app.extensions import db, query_cache
+from app.models import Producto, TIPOS_PRODUCTO
+
+# Filas por COPY / executemany
+LOTE = 20000
+
+_PRENDAS = {
+    'gorra': ['Gorra', 'Gorra Trucker', 'Visera', 'Cap', 'Gorro'],
+    'lentes': ['Lentes', 'Anteojos de sol', 'Gafas', 'Lentes polarizados'],
+    'medias': ['Medias', 'Soquetes', 'Medias largas', 'Medias deportivas'],
+}
+_ESTILOS = ['Urbana', 'Clásica', 'Retro', 'Deportiva', 'Vintage', 'Street', 'Minimal', 'Oversize',
+            'Aviador', 'Skater', 'Premium', 'Básica', 'Estampada', 'Bordada', 'Reflex']
+_COLORES = ['negro', 'blanco', 'azul', 'rojo', 'verde', 'gris', 'beige', 'bordó', 'celeste', 'rosa',
+            'naranja', 'violeta', 'camel', 'oliva', 'multicolor']
+_MATERIALES = ['algodón', 'poliéster', 'gabardina', 'acetato', 'metal', 'lana', 'lino', 'nylon']
+_NOMBRES = ['Juan', 'María', 'Lucas', 'Sofía', 'Mateo', 'Valentina', 'Martín', 'Camila', 'Tomás',
+            'Lucía', 'Nicolás', 'Julieta', 'Santiago', 'Florencia', 'Agustín', 'Micaela']
+_APELLIDOS = ['González', 'Rodríguez', 'Gómez', 'Fernández', 'López', 'Díaz', 'Martínez', 'Pérez',
+              'García', 'Sánchez', 'Romero', 'Sosa', 'Álvarez', 'Torres', 'Ruiz', 'Benítez']
+_ENVIOS = [('D', 'MiCorreo Domicilio', 4500.0), ('S', 'MiCorreo Sucursal', 3200.0),
+           ('S', 'Andreani Sucursal', 3800.0), ('D', 'Andreani Domicilio', 5200.0)]
+# (estado, peso): la mayoría de los pedidos viejos ya se entregaron
+_ESTADOS = [('Entregado', 55), ('Enviado', 12), ('Pendiente', 15), ('En Aprobación', 6), ('Cancelado', 12)]
+_COMENTARIOS = ['Excelente calidad, llegó rápido.', 'Muy lindo, tal cual la foto.', 'Buen producto por el precio.',
+                'El color es un poco distinto al de la foto.', 'Tardó en llegar pero está bien.',
+                'Me encantó, voy a comprar otro.', 'La talla es más chica de lo esperado.',
+                'Regular, esperaba más.', 'Perfecto para regalar.', 'Súper cómodo.']
+
+
+# --- Inserción masiva ---
+
+def _valor_csv(valor):
+    if valor is None:
+        return None  # COPY csv: campo vacío sin comillas = NULL
+    if isinstance(valor, bool):
+        return 't' if valor else 'f'
+    if isinstance(valor, bytes):
+        return '\\x' + valor.hex()
+    if isinstance(valor, datetime):
+        return valor.isoformat(sep=' ')
+    if isinstance(valor, (list, dict)):
+        return json.dumps(valor)
+    return valor
+
+
+def _valor_sqlite(valor):
+    # Mismo formato que usa SQLAlchemy para guardar DateTime y JSON en SQLite
+    if isinstance(valor, datetime):
+        return valor.strftime('%Y-%m-%d %H:%M:%S.%f')
+    if isinstance(valor, (list, dict)):
+        return json.dumps(valor)
+    return valor
+
+
+def _columnas_a_convertir(filas, tipos):
+    """
+    Índices de las columnas cuyo primer valor no nulo es de 'tipos'. Convertir
+    solo esas (y no cada valor de cada fila) es la mitad del tiempo de carga.
+    """
+    pendientes = set(range(len(filas[0])))
+    convertir = []
+    for fila in filas:
+        for i in list(pendientes):
+            if fila[i] is not None:
+                pendientes.discard(i)
+                if isinstance(fila[i], tipos):
+                    convertir.append(i)
+        if not pendientes:
+            break
+    return convertir
+
+
+def _convertir(filas, indices, conversor):
+    if not indices:
+        return filas
+    convertidas = []
+    for fila in filas:
+        fila = list(fila)
+        for i in indices:
+            fila[i] = conversor(fila[i])
+        convertidas.append(fila)
+    return convertidas
+
+
+def _insertar(cursor, dialecto, tabla, columnas, filas):
+    """COPY en Postgres, executemany en el resto. 'filas' son tuplas en el orden de 'columnas'."""
+    if not filas:
+        return
+    if dialecto == 'postgresql':
+        indices = _columnas_a_convertir(filas, (bool, bytes, datetime, list, dict))
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(_convertir(filas, indices, _valor_csv))
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    else:
+        indices = _columnas_a_convertir(filas, (datetime, list, dict))
+        marcas = ', '.join('?' for _ in columnas)
+        cursor.executemany(f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({marcas})",
+                           _convertir(filas, indices, _valor_sqlite))
+
+
+def _siguiente_id(cursor, tabla):
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {tabla}")
+    return cursor.fetchone()[0]
+
+
+def _ajustar_secuencia(cursor, dialecto, tabla):
+    """Los ids se asignan acá: la secuencia de Postgres tiene que quedar después del último."""
+    if dialecto == 'postgresql':
+        cursor.execute(f"SELECT setval(pg_get_serial_sequence('{tabla}', 'id'), "
+                       f"(SELECT COALESCE(MAX(id), 1) FROM {tabla}))")
+
+
+# --- Imágenes ---
+
+def _jpegs_base(cantidad, tamano_kb, rnd):
+    """
+    Unas pocas fotos JPEG distintas (degradé + ruido) de aproximadamente tamano_kb.
+    Codificar con Pillow es lo caro: el resto de las imágenes reusa estas bases.
+    """
+    ancho, alto = 1200, 1200
+    bases = []
+    for i in range(cantidad):
+        for _ in range(2):  # una corrección de escala para acercarse al tamaño pedido
+            fondo = Image.linear_gradient('L').resize((ancho, alto)).convert('RGB')
+            color = Image.new('RGB', (ancho, alto), tuple(rnd.randrange(256) for _ in range(3)))
+            ruido = Image.merge('RGB', [Image.effect_noise((ancho, alto), 40 + 10 * i)] * 3)
+            img = Image.blend(Image.blend(fondo, color, 0.5), ruido, 0.25)
+            buffer = io.BytesIO()
+            img.save(buffer, format='JPEG', quality=75)
+            datos = buffer.getvalue()
+            escala = (tamano_kb * 1024 / len(datos)) ** 0.5
+            if 0.85 < escala < 1.15:
+                break
+            ancho = max(64, min(2400, int(ancho * escala)))
+            alto = ancho
+        bases.append(datos)
+    return bases
+
+
+def _lotes_imagenes(nombres, usos, tamano_kb, primer_id, rnd, lote=500):
+    """
+    Filas de producto_imagenes (originales en la DB), de a 'lote' para no tener
+    todos los blobs en memoria. 'usos' es {nombre: productos que la usan}: va a
+    'referencias', así borrar una foto desde el admin no se lleva la de otros.
+    """
+    bases = _jpegs_base(min(len(nombres), 8), tamano_kb, rnd)
+    ahora = datetime.now()
+    filas = []
+    for i, nombre in enumerate(nombres):
+        # Bytes después del marcador EOI: el JPEG sigue siendo válido y cada imagen tiene su propio etag
+        datos = bases[i % len(bases)] + uuid4().bytes
+        etag = hashlib.sha256(datos).hexdigest()
+        filas.append((primer_id + i, nombre, datos, 'image/jpeg', 'db', len(datos),
+                      etag, max(1, usos[nombre]), etag, ahora))
+        if len(filas) >= lote:
+            yield filas
+            filas = []
+    if filas:
+        yield filas
+
+
+# --- Generador ---
+
+def _elegir_estado(rnd):
+    return rnd.choices([e for e, _ in _ESTADOS], weights=[p for _, p in _ESTADOS])[0]
+
+
+def generar(categorias=20, productos=2000, pedidos=20000, resenas=10000, imagenes=200,
+            imagen_kb=150, detalles_max=5, dias=730, semilla=None, log=print):
+    """
+    Carga datos sintéticos con volúmenes configurables para pruebas de carga.
+    Se suman a lo que ya haya en la base (los ids arrancan después del máximo).
+    Los pedidos tienen entre 1 y detalles_max productos (la mayoría 1 o 2), las
+    fechas se reparten en los últimos 'dias' días y los clientes se repiten.
+    Devuelve {tabla: filas insertadas}.
+    """
+    rnd = random.Random(semilla)
+    dialecto = db.engine.dialect.name
+    resumen = {}
+
+    def cronometrar(tabla, cantidad, inicio):
+        resumen[tabla] = resumen.get(tabla, 0) + cantidad
+        log(f"  {tabla}: {cantidad} filas en {time.perf_counter() - inicio:.1f}s")
+
+    with db.engine.begin() as conn:
+        cursor = conn.connection.cursor()
+
+        # Los nombres de las imágenes se eligen antes; las filas se insertan después de los
+        # productos, cuando ya se sabe cuántos usan cada una
+        nombres_imagenes = [f"seed_{uuid4().hex}.jpg" for _ in range(imagenes)]
+        usos_imagenes = Counter()
+
+        # Categorías (el id en el nombre lo hace único aunque se corra varias veces)
+        inicio = time.perf_counter()
+        primer_categoria = _siguiente_id(cursor, 'categorias')
+        ids_categorias = list(range(primer_categoria, primer_categoria + categorias))
+        _insertar(cursor, dialecto, 'categorias', ('id', 'nombre', 'activa'), [
+            (cid, f"{rnd.choice(_ESTILOS)} {cid}", rnd.random() > 0.05) for cid in ids_categorias
+        ])
+        cronometrar('categorias', categorias, inicio)
+
+        # Productos: se guardan nombre y precio para los detalles de pedido
+        inicio = time.perf_counter()
+        primer_producto = _siguiente_id(cursor, 'productos')
+        catalogo = []
+        columnas = ('id', 'nombre', 'tipo', 'categoria_id', 'descripcion', 'fotos', 'stock', 'precio',
+                    'peso_g', 'alto_cm', 'ancho_cm', 'largo_cm', 'activo', 'umbral_stock',
+                    'rating_count', 'rating_sum')
+        filas = []
+        for i in range(productos):
+            pid = primer_producto + i
+            tipo = rnd.choice(TIPOS_PRODUCTO)
+            color = rnd.choice(_COLORES)
+            nombre = f"{rnd.choice(_PRENDAS[tipo])} {rnd.choice(_ESTILOS)} {color.capitalize()} {pid}"
+            descripcion = (f"{rnd.choice(_PRENDAS[tipo])} de {rnd.choice(_MATERIALES)} color {color}, "
+                           f"estilo {rnd.choice(_ESTILOS).lower()}. Ideal para el día a día.")
+            if nombres_imagenes:
+                # Todas las imágenes quedan usadas (si no, el GC las borraría) y algunas se comparten
+                fotos = [nombres_imagenes[i % len(nombres_imagenes)]]
+                fotos += rnd.sample(nombres_imagenes, min(len(nombres_imagenes), rnd.randint(0, 2)))
+                fotos = list(dict.fromkeys(fotos))
+                usos_imagenes.update(fotos)
+            else:
+                fotos = None
+            precio = float(rnd.randrange(2500, 60000, 100))
+            catalogo.append((pid, nombre, precio))
+            filas.append((pid, nombre, tipo, rnd.choice(ids_categorias) if ids_categorias else None,
+                          descripcion, fotos, rnd.randint(0, 300), precio, rnd.randint(50, 400),
+                          10, 10, 10, rnd.random() > 0.05, 5, 0, 0))
+            if len(filas) >= LOTE:
+                _insertar(cursor, dialecto, 'productos', columnas, filas)
+                filas = []
+        _insertar(cursor, dialecto, 'productos', columnas, filas)
+        cronometrar('productos', productos, inicio)
+
+        # Imágenes, con referencias = cantidad de productos que las usan
+        if nombres_imagenes:
+            inicio = time.perf_counter()
+            primer_imagen = _siguiente_id(cursor, 'producto_imagenes')
+            for filas in _lotes_imagenes(nombres_imagenes, usos_imagenes, imagen_kb, primer_imagen, rnd):
+                _insertar(cursor, dialecto, 'producto_imagenes',
+                          ('id', 'nombre', 'datos', 'mimetype', 'almacenamiento', 'tamano',
+                           'hash_origen', 'referencias', 'etag', 'creado'), filas)
+            cronometrar('producto_imagenes', imagenes, inicio)
+
+        if catalogo:
+            # Pedidos y detalles, de a lotes para no tener millones de filas en memoria
+            inicio = time.perf_counter()
+            primer_pedido = _siguiente_id(cursor, 'pedidos')
+            primer_detalle = _siguiente_id(cursor, 'detalles_pedido')
+            clientes = max(1, pedidos // 4)
+            ahora = datetime.now()
+            col_pedidos = ('id', 'nombre_cliente', 'email_cliente', 'telefono_cliente', 'direccion_cliente',
+                           'cp_cliente', 'envio_tipo', 'envio_nombre', 'envio_precio', 'total_productos',
+                           'total', 'fecha_pedido', 'estado', 'pagado', 'codigo_seguimiento',
+                           'empresa_envio', 'metodo_pago', 'cupon_codigo', 'descuento_monto')
+            col_detalles = ('id', 'pedido_id', 'producto_id', 'nombre_producto', 'cantidad', 'precio_unitario')
+            total_detalles = 0
+            for desde in range(0, pedidos, LOTE):
+                filas_pedidos, filas_detalles = [], []
+                for i in range(desde, min(pedidos, desde + LOTE)):
+                    pedido_id = primer_pedido + i
+                    cliente = rnd.randrange(clientes)
+                    nombre = f"{_NOMBRES[cliente % len(_NOMBRES)]} {_APELLIDOS[(cliente // len(_NOMBRES)) % len(_APELLIDOS)]}"
+                    cantidad_items = min(detalles_max, 1 + int(rnd.expovariate(1.2)))
+                    total_productos = 0.0
+                    for producto_id, nombre_producto, precio in rnd.sample(catalogo, min(cantidad_items, len(catalogo))):
+                        cantidad = rnd.choices((1, 2, 3), weights=(80, 15, 5))[0]
+                        total_productos += cantidad * precio
+                        filas_detalles.append((primer_detalle + total_detalles, pedido_id, producto_id,
+                                               nombre_producto, cantidad, precio))
+                        total_detalles += 1
+                    envio_tipo, envio_nombre, envio_precio = rnd.choice(_ENVIOS)
+                    metodo = rnd.choice(('transferencia', 'mercadopago'))
+                    descuento = round(total_productos * 0.1, 2) if metodo == 'transferencia' else 0.0
+                    estado = _elegir_estado(rnd)
+                    enviado = estado in ('Enviado', 'Entregado')
+                    filas_pedidos.append((
+                        pedido_id, nombre, f"cliente{cliente}@example.com", f"11{cliente:08d}"[:20],
+                        f"Calle {rnd.randint(1, 9999)} {rnd.randint(1, 5000)}", f"{rnd.randint(1000, 9499)}",
+                        envio_tipo, envio_nombre, envio_precio, total_productos,
+                        total_productos - descuento + envio_precio,
+                        ahora - timedelta(seconds=rnd.randrange(max(1, dias) * 86400)),
+                        estado, estado not in ('Pendiente', 'Cancelado'),
+                        f"AR{pedido_id:010d}" if enviado else None, envio_nombre.split()[0] if enviado else None,
+                        metodo, None, descuento,
+                    ))
+                _insertar(cursor, dialecto, 'pedidos', col_pedidos, filas_pedidos)
+                _insertar(cursor, dialecto, 'detalles_pedido', col_detalles, filas_detalles)
+            cronometrar('pedidos', pedidos, inicio)
+            resumen['detalles_pedido'] = total_detalles
+            log(f"  detalles_pedido: {total_detalles} filas (incluidas arriba)")
+
+            # Reseñas: sesgadas a 4-5 estrellas y a los productos más populares
+            inicio = time.perf_counter()
+            primer_resena = _siguiente_id(cursor, 'resenas')
+            columnas = ('id', 'producto_id', 'nombre_cliente', 'calificacion', 'comentario', 'fecha')
+            filas = []
+            for i in range(resenas):
+                producto_id = catalogo[min(len(catalogo) - 1, int(rnd.paretovariate(1.2)) - 1)][0] \
+                    if rnd.random() < 0.3 else rnd.choice(catalogo)[0]
+                filas.append((primer_resena + i, producto_id,
+                              f"{rnd.choice(_NOMBRES)} {rnd.choice(_APELLIDOS)[0]}.",
+                              rnd.choices((1, 2, 3, 4, 5), weights=(5, 5, 12, 33, 45))[0],
+                              rnd.choice(_COMENTARIOS),
+                              ahora - timedelta(seconds=rnd.randrange(max(1, dias) * 86400))))
+                if len(filas) >= LOTE:
+                    _insertar(cursor, dialecto, 'resenas', columnas, filas)
+                    filas = []
+            _insertar(cursor, dialecto, 'resenas', columnas, filas)
+            cronometrar('resenas', resenas, inicio)
+
+        for tabla in ('producto_imagenes', 'categorias', 'productos', 'pedidos', 'detalles_pedido', 'resenas'):
+            _ajustar_secuencia(cursor, dialecto, tabla)
+        cursor.close()
+
+    # Agregados de reseñas y estadísticas del planner para el volumen nuevo
+    inicio = time.perf_counter()
+    Producto.recalcular_calificaciones()
+    db.session.commit()
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('ANALYZE')
+    log(f"  calificaciones y ANALYZE en {time.perf_counter() - inicio:.1f}s")
+
+    # Los inserts crudos no pasan por los eventos de la sesión
+    query_cache.invalidar_tags('Categoria', 'Producto', 'Pedido', 'DetallePedido', 'Resena', 'ProductoImagen')
+    return resumen
@@ -1,10 +1,10 @@
 // Cargar carrito
 let carrito = JSON.parse(localStorage.getItem('carrito')) || [];
-let productosDisponibles = {}; // Cache de productos con stock
+let productosDisponibles = {}; // Stock y precio vigentes de los productos cotizados (los del carrito)
 
 document.addEventListener("DOMContentLoaded", function () {
     actualizarBadge();
-    cargarProductos(); // Cargar stock de productos
+    sincronizarCarrito(); // Precios y stock reales de lo que ya está en el carrito
     actualizarEstadoProductos();
 
     if (document.getElementById('tabla-carrito')) {
@@ -23,6 +23,7 @@ document.addEventListener("DOMContentLoaded", function () {
     initAjaxFilters();
     initBackToTop();
     initSort();
+    initSugerencias();
 });
 
 // Cache para los productos de la página actual para la Vista Rápida
@@ -69,6 +70,46 @@ function initAjaxFilters() {
     }
 }
 
+// Autocompletado del buscador (/api/buscar/sugerencias)
+function initSugerencias() {
+    const searchInput = document.querySelector('input[name="q"][list="sugerencias-busqueda"]');
+    const datalist = document.getElementById('sugerencias-busqueda');
+    if (!searchInput || !datalist) return;
+
+    let timeout = null;
+    let urls = {};
+    searchInput.addEventListener('input', function () {
+        // Si eligió una sugerencia de la lista, ir directo al producto/categoría
+        if (urls[this.value]) {
+            window.location.href = urls[this.value];
+            return;
+        }
+        clearTimeout(timeout);
+        const texto = this.value.trim();
+        if (!texto) {
+            datalist.innerHTML = '';
+            return;
+        }
+        timeout = setTimeout(async () => {
+            try {
+                const resp = await fetch(`/api/buscar/sugerencias?q=${encodeURIComponent(texto)}`);
+                const sugerencias = await resp.json();
+                urls = {};
+                datalist.innerHTML = '';
+                sugerencias.forEach(s => {
+                    const option = document.createElement('option');
+                    option.value = s.nombre;
+                    if (s.tipo === 'categoria') option.label = 'Categoría';
+                    urls[s.nombre] = s.url;
+                    datalist.appendChild(option);
+                });
+            } catch (e) {
+                console.error('Error cargando sugerencias', e);
+            }
+        }, 120);
+    });
+}
+
 function initSort() {
     const sortSelect = document.getElementById('sort-select');
     if (!sortSelect) return;
@@ -189,21 +230,64 @@ function initBackToTop() {
     });
 }
 
-// Cargar productos con stock desde la API
-async function cargarProductos() {
+// Cotiza en el servidor solo las líneas pedidas ([{id, cantidad}]): precio, stock y subtotal vigentes
+async function cotizarCarrito(items) {
     try {
-        const res = await fetch('/api/productos');
-        const productos = await res.json();
-        productos.forEach(prod => {
-            productosDisponibles[prod.id] = prod;
+        const res = await fetch('/api/carrito/cotizar', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(items.map(item => ({ id: item.id, cantidad: item.cantidad })))
         });
-        actualizarEstadoProductos(); // Actualizar estado con stock real
+        const data = await res.json();
+        if (!data.ok) return null;
+        data.items.forEach(linea => {
+            productosDisponibles[linea.id] = linea;
+        });
+        return data;
     } catch (e) {
-        console.error('Error al cargar productos:', e);
+        console.error('Error al cotizar el carrito:', e);
+        return null;
     }
 }
 
-function agregarAlCarrito(id, nombre, precio) {
+// Actualiza el carrito guardado con los precios reales y saca lo que ya no se puede comprar
+async function sincronizarCarrito() {
+    if (carrito.length === 0) return;
+    const data = await cotizarCarrito(carrito);
+    if (!data) return;
+
+    let quitados = false;
+    carrito = carrito.filter(prod => {
+        const linea = productosDisponibles[prod.id];
+        if (!linea || linea.precio === null || linea.stock <= 0) {
+            quitados = true;
+            return false;
+        }
+        prod.nombre = linea.nombre;
+        prod.precio = linea.precio;
+        if (prod.cantidad > linea.stock) {
+            prod.cantidad = linea.stock;
+            quitados = true;
+        }
+        return true;
+    });
+
+    actualizarStorage();
+    actualizarBadge();
+    actualizarEstadoProductos();
+    mostrarCarrito();
+    actualizarOffcanvas();
+
+    if (quitados) {
+        Swal.fire({
+            icon: 'info',
+            text: 'Actualizamos tu carrito: algunos productos ya no tienen stock suficiente.',
+            confirmButtonColor: '#4F5D2F'
+        });
+    }
+}
+
+async function agregarAlCarrito(id, nombre, precio) {
     const inputCantidad = document.getElementById('cantidad-' + id);
     const cantidadElegida = inputCantidad ? parseInt(inputCantidad.value) : 1;
 
@@ -217,33 +301,34 @@ function agregarAlCarrito(id, nombre, precio) {
         return;
     }
 
-    // Validar stock disponible
-    const producto = productosDisponibles[id];
-    if (!producto) {
+    // Calcular cantidad total si ya está en el carrito
+    const existe = carrito.find(p => p.id === id);
+    const cantidadTotal = existe ? existe.cantidad + cantidadElegida : cantidadElegida;
+
+    // Validar stock disponible (se cotiza solo este producto)
+    const data = await cotizarCarrito([{ id, cantidad: cantidadTotal }]);
+    if (!data) {
         Swal.fire({
-            icon: 'info',
-            text: 'Cargando información del producto...',
-            timer: 1500,
-            showConfirmButton: false
+            icon: 'error',
+            title: 'Ups...',
+            text: 'No pudimos verificar el stock. Intentá de nuevo.',
+            confirmButtonColor: '#4F5D2F'
         });
-        cargarProductos();
         return;
     }
+    const producto = productosDisponibles[id];
 
-    if (producto.stock <= 0) {
+    if (producto.precio === null || producto.stock <= 0) {
         Swal.fire({
             icon: 'error',
             title: 'Agotado',
             text: 'Lo sentimos, este producto no tiene stock en este momento.',
             confirmButtonColor: '#4F5D2F'
         });
+        actualizarEstadoProductos();
         return;
     }
 
-    // Calcular cantidad total si ya está en el carrito
-    const existe = carrito.find(p => p.id === id);
-    const cantidadTotal = existe ? existe.cantidad + cantidadElegida : cantidadElegida;
-
     // Validar que no supere el stock disponible
     if (cantidadTotal > producto.stock) {
         Swal.fire({
@@ -255,10 +340,12 @@ function agregarAlCarrito(id, nombre, precio) {
         return;
     }
 
-    const item = { id, nombre, precio, cantidad: cantidadElegida };
+    // El precio es el del servidor, no el que quedó en la página
+    const item = { id, nombre: producto.nombre, precio: producto.precio, cantidad: cantidadElegida };
 
     if (existe) {
         existe.cantidad += cantidadElegida;
+        existe.precio = producto.precio;
     } else {
         carrito.push(item);
     }
@@ -0,0 +1,210 @@
+"""
+Benchmark de concurrencia del checkout (/finalizar).
+
+Dispara muchas compras simultáneas contra pocos productos con poco stock y
+reporta pedidos/s, latencias (p50/p95/p99) y el tiempo esperando locks de
+stock. Al final verifica lo importante: que el stock nunca quede negativo y
+que lo descontado coincida con la suma de DetallePedido.cantidad.
+
+Por defecto usa una base SQLite temporal (no necesita Postgres). Para correrlo
+contra otra base: --db postgresql://... (los datos de prueba se borran al final).
+Los mails y Mercado Pago se reemplazan por stubs: se mide la app, no la red.
+
+    python bench_checkout.py --compras 400 --hilos 32 --productos 5 --stock 20
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+def parsear_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--compras', type=int, default=400, help='Checkouts a disparar en total.')
+    parser.add_argument('--hilos', type=int, default=32, help='Checkouts simultáneos.')
+    parser.add_argument('--productos', type=int, default=5, help='Productos en juego.')
+    parser.add_argument('--stock', type=int, default=20, help='Stock inicial de cada producto.')
+    parser.add_argument('--items-max', type=int, default=3, help='Líneas máximas por carrito.')
+    parser.add_argument('--mercadopago', type=float, default=0.3, help='Fracción de compras con Mercado Pago.')
+    parser.add_argument('--db', default=None, help='URL de la base (por defecto SQLite temporal).')
+    parser.add_argument('--semilla', type=int, default=None)
+    return parser.parse_args()
+
+
+def bench_checkout(args):
+    archivo_temporal = None
+    if args.db:
+        os.environ['DATABASE_URL'] = args.db
+    else:
+        archivo_temporal = os.path.join(tempfile.mkdtemp(prefix='bench_checkout_'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{archivo_temporal}'
+        os.environ.setdefault('APP_PROFILE', 'local')
+
+    # La configuración se lee al importar: después de elegir la base
+    from sqlalchemy import event
+    from app import create_app
+    from app.extensions import db
+    from app.models import Producto, Categoria, Pedido, DetallePedido
+    import app.routes.checkout as checkout_routes
+
+    class PagoStub:
+        def __init__(self, access_token):
+            pass
+
+        def create_preference(self, pedido, **kwargs):
+            return f'https://mercadopago.invalid/checkout/{pedido.id}'
+
+    checkout_routes.enviar_emails_checkout = lambda *a, **k: None
+    checkout_routes.PaymentService = PagoStub
+
+    app = create_app()
+    app.config['MERCADOPAGO_ACCESS_TOKEN'] = 'bench'
+    rnd = random.Random(args.semilla)
+    sufijo = uuid.uuid4().hex[:8]
+    email = f'bench-{sufijo}@example.com'
+
+    with app.app_context():
+        cat = Categoria(nombre=f'Bench Cat {sufijo}', activa=True)
+        db.session.add(cat)
+        db.session.flush()
+        productos = [
+            Producto(nombre=f'Bench Prod {sufijo} {i}', precio=1000.0, stock=args.stock, categoria_id=cat.id, activo=True)
+            for i in range(args.productos)
+        ]
+        db.session.add_all(productos)
+        db.session.commit()
+        cat_id = cat.id
+        ids = [p.id for p in productos]
+        # Un request previo: configuración y cachés calientes antes de medir
+        app.test_client().get('/productos')
+
+        # Tiempo en las sentencias que toman los locks de stock (FOR UPDATE / UPDATE guardado)
+        esperas = []
+        esperas_lock = threading.Lock()
+
+        def _antes(conn, cursor, statement, parameters, context, executemany):
+            conn.info['bench_inicio'] = time.perf_counter()
+
+        def _despues(conn, cursor, statement, parameters, context, executemany):
+            inicio = conn.info.pop('bench_inicio', None)
+            if inicio is not None and 'productos' in statement and (
+                    statement.lstrip().upper().startswith('UPDATE') or 'FOR UPDATE' in statement.upper()):
+                with esperas_lock:
+                    esperas.append(time.perf_counter() - inicio)
+
+        event.listen(db.engine, 'before_cursor_execute', _antes)
+        event.listen(db.engine, 'after_cursor_execute', _despues)
+
+    resultados = []  # (segundos, resultado)
+    resultados_lock = threading.Lock()
+    pendientes = iter(range(args.compras))
+    pendientes_lock = threading.Lock()
+
+    def carrito_al_azar():
+        lineas = []
+        for pid in rnd.sample(ids, rnd.randint(1, min(args.items_max, len(ids)))):
+            lineas.append({'id': pid, 'nombre': f'Bench {pid}', 'precio': 1000.0, 'cantidad': rnd.randint(1, 2)})
+        if rnd.random() < 0.1:
+            lineas.append(dict(lineas[0]))  # línea repetida: el checkout tiene que sumarlas
+        return lineas
+
+    def trabajador():
+        cliente = app.test_client()
+        while True:
+            with pendientes_lock:
+                if next(pendientes, None) is None:
+                    return
+                carrito = carrito_al_azar()
+                metodo = 'mercadopago' if rnd.random() < args.mercadopago else 'transferencia'
+            inicio = time.perf_counter()
+            try:
+                resp = cliente.post('/finalizar', data={
+                    'nombre': 'Bench', 'email': email, 'telefono': '1100000000', 'direccion': 'Calle 123',
+                    'cp': '1000', 'metodo_pago': metodo, 'envio_tipo': 'D', 'envio_nombre': 'MiCorreo',
+                    'envio_precio': '0', 'carrito_data': json.dumps(carrito),
+                })
+                destino = resp.headers.get('Location', '')
+                if resp.status_code == 200 or 'mercadopago.invalid' in destino:
+                    resultado = 'pedido'
+                elif resp.status_code == 302:
+                    resultado = 'rechazado'
+                else:
+                    resultado = f'http {resp.status_code}'
+            except Exception as e:
+                resultado = f'error {type(e).__name__}'
+            with resultados_lock:
+                resultados.append((time.perf_counter() - inicio, resultado))
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=trabajador) for _ in range(args.hilos)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+
+    with app.app_context():
+        try:
+            latencias = [s for s, _ in resultados]
+            latencias_ok = [s for s, r in resultados if r == 'pedido']
+            conteo = {}
+            for _, r in resultados:
+                conteo[r] = conteo.get(r, 0) + 1
+            print(f"Base: {db.engine.dialect.name}  compras: {args.compras}  hilos: {args.hilos}  "
+                  f"productos: {args.productos} x stock {args.stock}")
+            print(f"Resultados: {conteo}")
+            print(f"Duración: {duracion:.2f}s  pedidos/s: {conteo.get('pedido', 0) / duracion:.1f}  "
+                  f"requests/s: {len(resultados) / duracion:.1f}")
+            print(f"Latencia (ms)  p50: {percentil(latencias, 50) * 1000:.1f}  p95: {percentil(latencias, 95) * 1000:.1f}  "
+                  f"p99: {percentil(latencias, 99) * 1000:.1f}  max: {max(latencias, default=0) * 1000:.1f}")
+            if latencias_ok:
+                print(f"Latencia pedidos ok (ms)  p50: {percentil(latencias_ok, 50) * 1000:.1f}  "
+                      f"p99: {percentil(latencias_ok, 99) * 1000:.1f}")
+            print(f"Locks de stock: {len(esperas)} sentencias, total {sum(esperas):.2f}s, "
+                  f"p50 {percentil(esperas, 50) * 1000:.1f}ms, p99 {percentil(esperas, 99) * 1000:.1f}ms")
+
+            # Verificación: sin stock negativo y stock descontado == unidades vendidas
+            db.session.expire_all()
+            pedidos_ok = Pedido.query.filter_by(email_cliente=email).count()
+            vendidos = dict(db.session.query(DetallePedido.producto_id, db.func.sum(DetallePedido.cantidad))
+                            .filter(DetallePedido.producto_id.in_(ids)).group_by(DetallePedido.producto_id).all())
+            errores = []
+            for producto in Producto.query.filter(Producto.id.in_(ids)).order_by(Producto.id):
+                vendido = int(vendidos.get(producto.id) or 0)
+                print(f"  producto {producto.id}: stock final {producto.stock}, vendidos {vendido}")
+                if producto.stock < 0:
+                    errores.append(f"stock negativo en {producto.id}: {producto.stock}")
+                if args.stock - producto.stock != vendido:
+                    errores.append(f"producto {producto.id}: se descontaron {args.stock - producto.stock} "
+                                   f"pero los detalles suman {vendido}")
+            if pedidos_ok != conteo.get('pedido', 0):
+                errores.append(f"{pedidos_ok} pedidos guardados y {conteo.get('pedido', 0)} respuestas de éxito")
+            assert not errores, "\n".join(errores)
+            print("Verification successful!")
+        finally:
+            if archivo_temporal is None:
+                pedidos = [p for (p,) in db.session.query(Pedido.id).filter_by(email_cliente=email)]
+                DetallePedido.query.filter(DetallePedido.pedido_id.in_(pedidos)).delete(synchronize_session=False)
+                Pedido.query.filter(Pedido.id.in_(pedidos)).delete(synchronize_session=False)
+                Producto.query.filter(Producto.id.in_(ids)).delete(synchronize_session=False)
+                Categoria.query.filter_by(id=cat_id).delete()
+                db.session.commit()
+                print("Test cleanup done.")
+            else:
+                db.session.remove()
+                db.engine.dispose()
+
+
+if __name__ == "__main__":
+    bench_checkout(parsear_args())
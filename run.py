@@ -8,45 +8,8 @@ from app.models import Admin
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
-        
-        # --- Migración automática de base de datos ---
-        try:
-            with db.engine.connect() as connection:
-                from sqlalchemy import text
-                
-                # Lista de comandos de migración seguros
-                commands = [
-                    "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS estado VARCHAR(50) DEFAULT 'Pendiente'",
-                    "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS pagado BOOLEAN DEFAULT FALSE",
-                    "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS codigo_seguimiento VARCHAR(100)",
-                    "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS link_seguimiento VARCHAR(300)",
-                    "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS empresa_envio VARCHAR(100)",
-                    "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS metodo_pago VARCHAR(50) DEFAULT 'transferencia'",
-                    "ALTER TABLE configuracion ADD COLUMN IF NOT EXISTS hero_image_1 VARCHAR(255)",
-                    "ALTER TABLE configuracion ADD COLUMN IF NOT EXISTS hero_image_2 VARCHAR(255)",
-                    "ALTER TABLE configuracion ADD COLUMN IF NOT EXISTS hero_image_3 VARCHAR(255)",
-                    "ALTER TABLE configuracion ADD COLUMN IF NOT EXISTS hero_image_4 VARCHAR(255)",
-                    "ALTER TABLE productos ADD COLUMN IF NOT EXISTS umbral_stock INTEGER DEFAULT 5",
-                    "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS cupon_codigo VARCHAR(50)",
-                    "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS descuento_monto FLOAT DEFAULT 0",
-                    "ALTER TABLE configuracion ADD COLUMN IF NOT EXISTS descuento_transferencia FLOAT DEFAULT 10.0",
-                    "ALTER TABLE configuracion DROP COLUMN IF EXISTS google_apps_script_url",
-                    "ALTER TABLE configuracion DROP COLUMN IF EXISTS email_webhook_token"
-                ]
-                
-                for cmd in commands:
-                    try:
-                        # Usamos begin() para una transacción individual por comando
-                        with db.engine.begin() as conn:
-                            conn.execute(text(cmd))
-                    except Exception:
-                        # Ignorar errores individuales (ej. si la columna ya existe y el IF NOT EXISTS no basta)
-                        pass
-                
-                print("Base de datos actualizada: Columnas nuevas verificadas.")
-        except Exception as e:
-            print(f"Nota: No se pudo actualizar la estructura de la DB automáticamente (puede que ya esté actualizada): {e}")
+        # El esquema lo mantiene app/migrations.py: create_app() ya aplicó las pendientes
+        # (o avisó, con AUTO_MIGRATE=0) y creó la fila de configuración. Acá solo va el admin.
 
         # Crear usuario admin por defecto si no existe
         if not Admin.query.first():
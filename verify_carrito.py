@@ -0,0 +1,53 @@
+"""
+Carritos malformados contra /api/carrito/cotizar y /finalizar: tienen que
+rechazarse con 400 (API) o con un aviso y redirección al carrito (checkout),
+nunca con un 500. Incluye ids y cantidades que no entran en un INTEGER.
+
+    python verify_carrito.py
+"""
+import json
+from app import create_app
+
+CARRITOS_INVALIDOS = [
+    'null',
+    '{"id": 1}',
+    '5',
+    '[1]',
+    '[{"id": null}]',
+    '[{"id": 1e400}]',                       # int() da OverflowError
+    '[{"id": 99999999999999999999999}]',     # entra en Python, desborda el driver
+    '[{"id": 0}]',
+    '[{"id": 1, "cantidad": 1e400}]',
+    '[{"id": 1, "cantidad": 99999999999999999999999}]',
+    '[{"id": 1, "cantidad": 2147483647}, {"id": 1, "cantidad": 1}]',
+]
+
+
+def verify_carrito():
+    app = create_app()
+    cliente = app.test_client()
+    errores = []
+    for carrito in CARRITOS_INVALIDOS:
+        resp = cliente.post('/api/carrito/cotizar', data=carrito, content_type='application/json')
+        if resp.status_code != 400:
+            errores.append(f"API {carrito}: HTTP {resp.status_code}")
+
+        resp = cliente.post('/finalizar', data={
+            'nombre': 'Verify', 'email': 'verify@example.com', 'metodo_pago': 'transferencia',
+            'carrito_data': carrito,
+        })
+        if resp.status_code != 302 or not resp.headers.get('Location', '').endswith('/carrito'):
+            errores.append(f"/finalizar {carrito}: HTTP {resp.status_code}")
+
+    # Un carrito bien formado con un producto que no existe se cotiza sin error
+    resp = cliente.post('/api/carrito/cotizar', data=json.dumps([{'id': 2147483647, 'cantidad': 1}]),
+                        content_type='application/json')
+    if resp.status_code != 200 or resp.get_json()['items'][0]['disponible']:
+        errores.append(f"Producto inexistente: HTTP {resp.status_code}")
+
+    assert not errores, "\n".join(errores)
+    print("Verification successful!")
+
+
+if __name__ == "__main__":
+    verify_carrito()
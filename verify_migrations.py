@@ -0,0 +1,103 @@
+"""
+Actualiza una base SQLite con el esquema anterior a las migraciones versionadas
+(lo que dejaba db.create_all con los modelos originales) y verifica que
+create_app la lleve a la última versión sin perder datos.
+
+    python verify_migrations.py
+"""
+import os
+import sqlite3
+import tempfile
+
+# Esquema de las tablas que tocan las migraciones, tal como lo creaba db.create_all antes del versionado
+ESQUEMA_ANTERIOR = """
+CREATE TABLE categorias (
+    id INTEGER NOT NULL, nombre VARCHAR(100) NOT NULL, activa BOOLEAN,
+    PRIMARY KEY (id), UNIQUE (nombre)
+);
+CREATE TABLE producto_imagenes (
+    id INTEGER NOT NULL, nombre VARCHAR(255) NOT NULL, datos BLOB NOT NULL, mimetype VARCHAR(100) NOT NULL,
+    PRIMARY KEY (id), UNIQUE (nombre)
+);
+CREATE TABLE pedidos (
+    id INTEGER NOT NULL, nombre_cliente VARCHAR(200) NOT NULL, email_cliente VARCHAR(120) NOT NULL,
+    telefono_cliente VARCHAR(20), direccion_cliente VARCHAR(300), cp_cliente VARCHAR(10),
+    envio_tipo VARCHAR(50), envio_nombre VARCHAR(100), envio_precio FLOAT, total_productos FLOAT NOT NULL,
+    total FLOAT NOT NULL, fecha_pedido DATETIME NOT NULL, estado VARCHAR(50), pagado BOOLEAN,
+    codigo_seguimiento VARCHAR(100), empresa_envio VARCHAR(100), metodo_pago VARCHAR(50),
+    cupon_codigo VARCHAR(50), descuento_monto FLOAT,
+    PRIMARY KEY (id)
+);
+CREATE TABLE productos (
+    id INTEGER NOT NULL, nombre VARCHAR(200) NOT NULL, tipo VARCHAR(50), categoria_id INTEGER,
+    descripcion TEXT, fotos JSON, stock INTEGER, precio FLOAT NOT NULL, peso_g INTEGER, alto_cm INTEGER,
+    ancho_cm INTEGER, largo_cm INTEGER, activo BOOLEAN, umbral_stock INTEGER,
+    PRIMARY KEY (id), FOREIGN KEY(categoria_id) REFERENCES categorias (id)
+);
+CREATE TABLE detalles_pedido (
+    id INTEGER NOT NULL, pedido_id INTEGER NOT NULL, producto_id INTEGER, nombre_producto VARCHAR(200) NOT NULL,
+    cantidad INTEGER NOT NULL, precio_unitario FLOAT NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(pedido_id) REFERENCES pedidos (id),
+    FOREIGN KEY(producto_id) REFERENCES productos (id) ON DELETE SET NULL
+);
+CREATE TABLE resenas (
+    id INTEGER NOT NULL, producto_id INTEGER NOT NULL, nombre_cliente VARCHAR(100) NOT NULL,
+    calificacion INTEGER NOT NULL, comentario TEXT, fecha DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(producto_id) REFERENCES productos (id) ON DELETE CASCADE
+);
+INSERT INTO categorias (id, nombre, activa) VALUES (1, 'Remeras', 1);
+INSERT INTO productos (id, nombre, categoria_id, stock, precio, activo, fotos)
+    VALUES (1, 'Remera vieja', 1, 3, 1000.0, 1, '["vieja.jpg"]');
+INSERT INTO resenas (id, producto_id, nombre_cliente, calificacion, comentario)
+    VALUES (1, 1, 'Ana', 4, 'Buena'), (2, 1, 'Luis', 2, 'Regular');
+INSERT INTO producto_imagenes (id, nombre, datos, mimetype) VALUES (1, 'vieja.jpg', X'FFD8FFD9', 'image/jpeg');
+"""
+
+
+def verify_migrations():
+    archivo = os.path.join(tempfile.mkdtemp(prefix='verify_migrations_'), 'anterior.db')
+    conexion = sqlite3.connect(archivo)
+    conexion.executescript(ESQUEMA_ANTERIOR)
+    conexion.close()
+
+    # La configuración se lee al importar: después de elegir la base
+    os.environ['DATABASE_URL'] = f'sqlite:///{archivo}'
+    os.environ['APP_PROFILE'] = 'local'
+    os.environ['AUTO_MIGRATE'] = '1'
+    from app import create_app
+    from app.extensions import db
+    from app.migrations import VERSION_ACTUAL, version_aplicada
+    from app.models import Producto, ProductoImagen
+
+    # Aplica las migraciones al arrancar
+    app = create_app()
+    with app.app_context():
+        assert version_aplicada() == VERSION_ACTUAL, f"Versión {version_aplicada()}, se esperaba {VERSION_ACTUAL}"
+
+        producto = db.session.get(Producto, 1)
+        assert (producto.rating_count, producto.rating_sum) == (2, 6), \
+            f"Calificaciones sin recalcular: {producto.rating_count}/{producto.rating_sum}"
+
+        imagen = db.session.get(ProductoImagen, 1)
+        assert imagen.datos == b'\xff\xd8\xff\xd9', "Se perdieron los bytes de la imagen"
+        assert imagen.almacenamiento == 'db' and imagen.referencias == 1 and imagen.creado is not None
+
+        # 'datos' admite NULL (imágenes guardadas fuera de la base)
+        db.session.add(ProductoImagen(nombre='afuera.jpg', datos=None, mimetype='image/jpeg',
+                                      almacenamiento='filesystem', tamano=10))
+        db.session.commit()
+
+        indices = {i['name'] for i in db.inspect(db.engine).get_indexes('producto_imagenes')}
+        assert 'ix_producto_imagenes_hash_origen' in indices, indices
+        columnas = {c['name'] for c in db.inspect(db.engine).get_columns('pedidos')}
+        assert 'clave_idempotencia' in columnas, columnas
+        db.session.remove()
+        db.engine.dispose()
+
+    # Un segundo arranque no tiene nada pendiente
+    create_app()
+    print("Verification successful!")
+
+
+if __name__ == "__main__":
+    verify_migrations()
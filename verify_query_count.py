@@ -0,0 +1,84 @@
+from app import create_app
+from app.extensions import db
+from app.models import Producto, Categoria, Resena
+from sqlalchemy import event
+import uuid
+
+# Consultas máximas para renderizar /productos con la caché caliente (página,
+# categorías del filtro, categoría actual; las globales y el conteo están cacheados)
+MAX_QUERIES = 5
+
+
+def contar_queries(app, client, url):
+    queries = []
+
+    def _contar(conn, cursor, statement, parameters, context, executemany):
+        queries.append(statement)
+
+    # Request previo: calienta la caché (el conteo se invalida al cambiar productos)
+    client.get(url)
+    # Sesión limpia: que no se reutilicen objetos ya cargados por el setup
+    db.session.remove()
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _contar)
+    try:
+        resp = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', _contar)
+    assert resp.status_code == 200, resp.status_code
+    return len(queries), resp
+
+
+def verify_query_count():
+    app = create_app()
+    with app.app_context():
+        suffix = str(uuid.uuid4())[:8]
+        cat = Categoria(nombre=f'Test Cat {suffix}', activa=True)
+        db.session.add(cat)
+        db.session.flush()
+
+        productos = [
+            Producto(nombre=f'Test Prod {suffix} {i}', precio=100.0, stock=10, categoria_id=cat.id, activo=True)
+            for i in range(12)
+        ]
+        db.session.add_all(productos)
+        db.session.commit()
+        cat_id = cat.id
+        ids = [p.id for p in productos]
+        url = f'/productos?categoria={cat_id}'
+        client = app.test_client()
+        # Primer request aparte (crea la configuración si falta, etc.)
+        client.get(url)
+
+        try:
+            # 1. Sin reseñas
+            sin_resenas, _ = contar_queries(app, client, url)
+            print(f"Sin reseñas: {sin_resenas} queries")
+
+            # 2. Con muchas reseñas por producto
+            for producto_id in ids:
+                for j in range(20):
+                    db.session.add(Resena(producto_id=producto_id, nombre_cliente='Tester',
+                                          calificacion=(j % 5) + 1, comentario='ok'))
+                    Producto.registrar_calificacion(producto_id, (j % 5) + 1)
+            db.session.commit()
+
+            con_resenas, resp = contar_queries(app, client, url)
+            print(f"Con {12 * 20} reseñas: {con_resenas} queries")
+
+            # 3. Verificar
+            assert sin_resenas == con_resenas, "La cantidad de queries depende de las reseñas (N+1)"
+            assert con_resenas <= MAX_QUERIES, f"Demasiadas queries: {con_resenas} > {MAX_QUERIES}"
+            assert b'3.0' in resp.data, "No se muestra el promedio de calificación"
+            print("Verification successful!")
+        finally:
+            # Cleanup
+            Resena.query.filter(Resena.producto_id.in_(ids)).delete(synchronize_session=False)
+            Producto.query.filter(Producto.id.in_(ids)).delete(synchronize_session=False)
+            Categoria.query.filter_by(id=cat_id).delete()
+            db.session.commit()
+            print("Test cleanup done.")
+
+
+if __name__ == "__main__":
+    verify_query_count()